@@ -13,6 +13,7 @@ import io
 import os
 import time
 import pandas as pd
+import numpy as np
 import threading
 import queue
 import json
@@ -24,6 +25,9 @@ sys.path.insert(0, str(Path(__file__).parent / 'src'))
 from main import run_pipeline
 from config_loader import ConfigLoader
 from sheets_writer import SheetsWriter
+from variance_engine import VarianceEngine
+from history_cache import history_cache, history_records
+from history_mirror import mirror_from_config
 
 
 # Page configuration
@@ -467,51 +471,64 @@ def get_processed_files_summary():
     return files[:10]  # Return last 10 files
 
 
-def get_recent_sheet_activity():
+def get_sheet_history():
     """
-    Fetch the last 10 rows from the Pricing Data Google Sheet.
+    Fetch the full Pricing Data history from the synced mirror or the shared cache.
 
     Returns:
-        pd.DataFrame: Recent pricing data, or empty DataFrame if error
+        pd.DataFrame: Full pricing history
+
+    Raises:
+        Exception: If the sheet cannot be loaded
     """
-    try:
-        # Load config
-        config = ConfigLoader()
-        gs_config = config.config.get('google_sheets', {})
+    config = ConfigLoader()
+    gs_config = config.config.get('google_sheets', {})
+    sheet_id = gs_config.get('sheet_id', '')
+    sheet_name = gs_config.get('sheet_name', 'Pricing Data')
+
+    mirror = mirror_from_config(config)
+    if mirror is not None and mirror.is_synced(sheet_id, sheet_name):
+        return mirror.load_history()
 
+    def load_history():
         # Initialize sheets writer
         writer = SheetsWriter(
-            sheet_id=gs_config.get('sheet_id', ''),
+            sheet_id=sheet_id,
             credentials_file=gs_config.get('credentials_file', 'credentials.json'),
             token_file=gs_config.get('token_file', 'token.json'),
-            sheet_name=gs_config.get('sheet_name', 'Pricing Data')
+            sheet_name=sheet_name
         )
 
         # Authenticate
         writer.authenticate()
 
-        # Get all data from sheet
-        result = writer.service.spreadsheets().values().get(
-            spreadsheetId=gs_config.get('sheet_id'),
-            range=f"{gs_config.get('sheet_name')}!A:N"
-        ).execute()
+        return VarianceEngine(mirror=mirror).load_historical_data(writer.service, sheet_id, sheet_name)
 
-        values = result.get('values', [])
+    # Shared with the pipeline: the sheet is only re-read after it changes
+    return history_cache.get_or_load(sheet_id, sheet_name, load_history)
 
-        if not values or len(values) < 2:
-            return pd.DataFrame()
 
-        # First row is headers
-        headers = values[0]
-        data_rows = values[1:]
+def get_recent_sheet_activity():
+    """
+    Fetch the last 10 rows from the Pricing Data Google Sheet.
 
-        # Get last 10 rows
-        recent_rows = data_rows[-10:] if len(data_rows) >= 10 else data_rows
+    Returns:
+        pd.DataFrame: Recent pricing data, or empty DataFrame if error
+    """
+    try:
+        # Load config
+        config = ConfigLoader()
+        gs_config = config.config.get('google_sheets', {})
+        sheet_id = gs_config.get('sheet_id', '')
+        sheet_name = gs_config.get('sheet_name', 'Pricing Data')
 
-        # Create DataFrame
-        df = pd.DataFrame(recent_rows, columns=headers)
+        # A synced local mirror answers without touching Google Sheets
+        mirror = mirror_from_config(config)
+        if mirror is not None and mirror.is_synced(sheet_id, sheet_name):
+            return pd.DataFrame(history_records(mirror.recent_rows(10)))
 
-        return df
+        # Last 10 rows, rendered as they appear in the sheet
+        return pd.DataFrame(history_records(get_sheet_history(), limit=10))
 
     except Exception as e:
         st.error(f"Failed to fetch recent activity: {e}")
@@ -1041,6 +1058,43 @@ def render_settings_tab():
 
     st.markdown("---")
 
+    # Threshold what-if over the stored variances
+    st.markdown("### 🔮 Threshold What-If")
+
+    with st.form("threshold_simulation"):
+        col1, col2 = st.columns(2)
+        with col1:
+            green_range = st.slider("Green range (%)", 0.0, 50.0, (1.0, 5.0), step=0.5)
+        with col2:
+            yellow_range = st.slider("Yellow range (%)", 0.0, 100.0, (5.0, 20.0), step=0.5)
+
+        simulate_submit = st.form_submit_button("🔮 Simulate")
+
+    if simulate_submit:
+        try:
+            with st.spinner("Loading pricing history..."):
+                history = get_sheet_history()
+
+            thresholds = config.get('variance_thresholds', {})
+            engine = VarianceEngine(
+                green_threshold=float(thresholds.get('green', 3.0)),
+                yellow_threshold=float(thresholds.get('yellow', 10.0))
+            )
+            results = engine.simulate_thresholds(
+                history,
+                np.arange(green_range[0], green_range[1] + 0.25, 0.5),
+                np.arange(yellow_range[0], yellow_range[1] + 0.25, 0.5)
+            )
+            results = results[results['green'] < results['yellow']]
+
+            st.caption(f"{len(results)} threshold pair(s) over {len(history)} historical row(s)")
+            st.dataframe(results, use_container_width=True, hide_index=True)
+
+        except Exception as e:
+            st.error(f"❌ Failed to simulate thresholds: {e}")
+
+    st.markdown("---")
+
     # Folder Paths
     st.markdown("### 📁 Folder Paths")
 
@@ -1312,6 +1366,14 @@ def render_upload_process_tab():
                         archived = "→ Archived" if filename in results['moved_files'] else ""
                         st.text(f"✓ {filename} {archived}")
 
+                # Files skipped as already in the sheet
+                if results.get('duplicate_files'):
+                    st.markdown("---")
+                    st.subheader("♻️ Skipped Duplicates")
+
+                    for filename, reason in results['duplicate_files']:
+                        st.warning(f"**{filename}**: {reason}")
+
                 # Failed files
                 if results['failed_files']:
                     st.markdown("---")
@@ -28,12 +28,18 @@ from pathlib import Path
 from datetime import datetime
 import asyncio
 import uuid
+import pandas as pd
 
 # Add src to path for existing modules
 sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from config_loader import ConfigLoader
+from history_cache import HistoryCache, compact_history, history_cache, history_records, memory_report
+from history_mirror import mirror_from_config, sku_entries
+from analysis_cache import cache_from_config
+from duplicate_index import duplicate_index_from_config
+from invoice_extractor import AsyncInvoiceExtractor, MAX_CONCURRENT_EXTRACTIONS, PAGES_PER_REQUEST
 from main import run_pipeline
 
 # Initialize FastAPI app
@@ -60,6 +66,9 @@ app.add_middleware(
 # Global state for processing jobs
 processing_jobs: Dict[str, Dict] = {}
 
+# Compact copy of the history kept resident for the read-only endpoints
+resident_history = HistoryCache()
+
 
 # ==================== Pydantic Models ====================
 
@@ -89,6 +98,12 @@ class VarianceSummary(BaseModel):
     recent_data: List[Dict]
 
 
+class ThresholdSimulation(BaseModel):
+    """Model for a threshold what-if grid"""
+    green: List[float] = Field(..., min_length=1, max_length=200)
+    yellow: List[float] = Field(..., min_length=1, max_length=200)
+
+
 # ==================== Helper Functions ====================
 
 def load_config_json() -> Dict:
@@ -113,51 +128,143 @@ def save_config_json(config_data: Dict) -> bool:
 
 
 def get_recent_sheet_data(limit: int = 10) -> List[Dict]:
-    """Fetch recent data from Google Sheets"""
+    """Fetch recent data from Google Sheets (via the shared history cache)"""
     try:
         config = ConfigLoader()
         gs_config = config.config.get('google_sheets', {})
+        sheet_id = gs_config.get('sheet_id', '')
+        sheet_name = gs_config.get('sheet_name', 'Pricing Data')
+
+        # A synced local mirror answers without touching Google Sheets
+        mirror = mirror_from_config(config)
+        if mirror is not None and mirror.is_synced(sheet_id, sheet_name):
+            return history_records(mirror.recent_rows(limit))
+
+        return history_records(get_sheet_history(), limit)
+
+    except Exception as e:
+        print(f"Error fetching sheet data: {e}")
+        return []
+
+
+def get_sheet_history():
+    """Compact Pricing Data history (from the synced mirror or the shared history cache), kept resident"""
+    config = ConfigLoader()
+    gs_config = config.config.get('google_sheets', {})
+    sheet_id = gs_config.get('sheet_id', '')
+    sheet_name = gs_config.get('sheet_name', 'Pricing Data')
+
+    def load_compact():
+        mirror = mirror_from_config(config)
+        if mirror is not None and mirror.is_synced(sheet_id, sheet_name):
+            return compact_history(mirror.load_history())
+
+        # The shared entry stays: pipeline runs reuse it as their delta-sync base
+        history = history_cache.get_or_load(
+            sheet_id, sheet_name, lambda: load_sheet_history(gs_config, mirror)
+        )
+        return compact_history(history)
+
+    # Writes made in this process bump the shared cache's version
+    version = history_cache.version(sheet_id, sheet_name)
+    history = resident_history.get(sheet_id, sheet_name)
+    if history is not None and history.attrs.get('history_version') == version:
+        return history
+
+    history = load_compact()
+    history.attrs['history_version'] = version
+    resident_history.put(sheet_id, sheet_name, history)
+    return history.copy(deep=False)
+
+
+def get_sku_entry(vendor_sku: str) -> Optional[Dict]:
+    """Price series of one SKU from the mirror's per-SKU table, or computed from the cached history"""
+    config = ConfigLoader()
+    gs_config = config.config.get('google_sheets', {})
+    sheet_id = gs_config.get('sheet_id', '')
+    sheet_name = gs_config.get('sheet_name', 'Pricing Data')
 
-        from sheets_writer import SheetsWriter
+    mirror = mirror_from_config(config)
+    if mirror is not None and mirror.is_synced(sheet_id, sheet_name):
+        return mirror.sku_history([vendor_sku]).get(vendor_sku)
+
+    history = get_sheet_history()
+    if history.empty:
+        return None
+
+    # The resident copy holds float32 costs; their shortest repr is the sheet's decimal value
+    rows = history[history['vendor_sku'] == vendor_sku]
+    rows = rows.assign(unit_cost=pd.to_numeric(rows['unit_cost'].astype(str), errors='coerce'))
+    return sku_entries(rows).get(vendor_sku)
+
+
+def load_sheet_history(gs_config: Dict, mirror=None):
+    """Authenticate and download the full Pricing Data history (seeding the mirror, if any)"""
+    from sheets_writer import SheetsWriter
+    from variance_engine import VarianceEngine
+
+    writer = SheetsWriter(
+        sheet_id=gs_config.get('sheet_id', ''),
+        credentials_file=gs_config.get('credentials_file', 'credentials.json'),
+        token_file=gs_config.get('token_file', 'token.json'),
+        sheet_name=gs_config.get('sheet_name', 'Pricing Data')
+    )
+    writer.authenticate()
+
+    return VarianceEngine(mirror=mirror).load_historical_data(
+        writer.service, writer.sheet_id, writer.sheet_name
+    )
+
+
+def load_duplicate_index(config: ConfigLoader):
+    """Load the duplicate index and prune it against the invoices currently in the sheet (None if unavailable)"""
+    from sheets_writer import SheetsWriter
+
+    duplicates = duplicate_index_from_config(config)
+    if duplicates is None:
+        return None
+
+    gs_config = config.config.get('google_sheets', {})
+    try:
         writer = SheetsWriter(
             sheet_id=gs_config.get('sheet_id', ''),
             credentials_file=gs_config.get('credentials_file', 'credentials.json'),
             token_file=gs_config.get('token_file', 'token.json'),
-            sheet_name=gs_config.get('sheet_name', 'Pricing Data')
+            sheet_name=gs_config.get('sheet_name', 'Pricing Data'),
+            mirror=mirror_from_config(config)
         )
-
         writer.authenticate()
+        if duplicates.load_invoices(writer.invoice_ids()):
+            duplicates.save()
+    except Exception as e:
+        print(f"[WARN]  Duplicate file check skipped: {e}")
+        return None
 
-        # Get all data from sheet
-        result = writer.service.spreadsheets().values().get(
-            spreadsheetId=gs_config.get('sheet_id'),
-            range=f"{gs_config.get('sheet_name')}!A:N"
-        ).execute()
+    return duplicates
 
-        values = result.get('values', [])
 
-        if not values or len(values) < 2:
-            return []
+async def extract_invoices(pdf_files: List[Path]) -> List:
+    """Extract the uploaded invoices inside the event loop, several at a time, skipping files already written"""
+    config = ConfigLoader()
+    max_concurrent = config.config.get('azure', {}).get('max_concurrent_extractions',
+                                                        MAX_CONCURRENT_EXTRACTIONS)
 
-        # First row is headers
-        headers = values[0]
-        data_rows = values[1:]
+    # Files whose rows were deleted from the sheet must not count as already written
+    to_extract, skipped = pdf_files, []
+    duplicates = await asyncio.to_thread(load_duplicate_index, config)
+    if duplicates is not None:
+        to_extract, skipped = duplicates.split_known_files(pdf_files)
 
-        # Get last N rows
-        recent_rows = data_rows[-limit:] if len(data_rows) >= limit else data_rows
+    async with AsyncInvoiceExtractor(endpoint=config.get_azure_endpoint(),
+                                     key=config.get_azure_key(),
+                                     cache=cache_from_config(config),
+                                     max_concurrent=max_concurrent,
+                                     pages_per_request=config.config.get('azure', {}).get(
+                                         'pages_per_request', PAGES_PER_REQUEST)) as extractor:
+        extracted = await extractor.extract_many(to_extract, max_concurrent=max_concurrent)
 
-        # Convert to list of dicts
-        result_data = []
-        for row in recent_rows:
-            # Pad row if needed
-            padded_row = row + [''] * (len(headers) - len(row))
-            result_data.append(dict(zip(headers, padded_row)))
-
-        return result_data
-
-    except Exception as e:
-        print(f"Error fetching sheet data: {e}")
-        return []
+    by_path = dict(skipped + extracted)
+    return [(pdf_path, by_path[pdf_path]) for pdf_path in pdf_files]
 
 
 async def run_processing_job(job_id: str, pdf_files: List[Path]):
@@ -167,12 +274,15 @@ async def run_processing_job(job_id: str, pdf_files: List[Path]):
         processing_jobs[job_id]['progress'] = 0.1
         processing_jobs[job_id]['message'] = 'Initializing services...'
 
-        await asyncio.sleep(0.5)
-        processing_jobs[job_id]['progress'] = 0.3
+        processing_jobs[job_id]['progress'] = 0.2
+        processing_jobs[job_id]['message'] = 'Extracting invoices...'
+        extractions = await extract_invoices(pdf_files)
+
+        processing_jobs[job_id]['progress'] = 0.5
         processing_jobs[job_id]['message'] = 'Processing invoices...'
 
-        # Run the pipeline
-        results = run_pipeline()
+        # Run the pipeline on the extracted invoices
+        results = run_pipeline(extractions=extractions)
 
         # Add Google Sheets URL to results
         config = load_config_json()
@@ -342,6 +452,75 @@ async def get_variance_summary():
         raise HTTPException(status_code=500, detail=f"Failed to fetch variance summary: {str(e)}")
 
 
+@app.post("/thresholds/simulate")
+async def simulate_thresholds(simulation: ThresholdSimulation):
+    """
+    Flag counts and dollar impact for every (green, yellow) threshold pair
+    """
+    try:
+        from variance_engine import VarianceEngine
+
+        config = ConfigLoader()
+        engine = VarianceEngine(
+            green_threshold=config.get_variance_threshold('green'),
+            yellow_threshold=config.get_variance_threshold('yellow')
+        )
+        results = engine.simulate_thresholds(get_sheet_history(), simulation.green, simulation.yellow)
+
+        return {
+            "current": {
+                "green": engine.green_threshold,
+                "yellow": engine.yellow_threshold
+            },
+            "results": results.to_dict(orient='records')
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to simulate thresholds: {str(e)}")
+
+
+@app.get("/sku-history/{vendor_sku}")
+async def get_sku_history(vendor_sku: str):
+    """
+    First/last seen, count, min/max/last cost and the unit cost series of one SKU
+    """
+    try:
+        entry = get_sku_entry(vendor_sku)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch SKU history: {str(e)}")
+
+    if entry is None:
+        raise HTTPException(status_code=404, detail="SKU not found")
+
+    dates = [None if date == 'NaT' else date.replace('T', ' ')
+             for date in entry['dates'].astype(str)]
+    costs = [None if cost != cost else float(cost) for cost in entry['costs']]
+
+    return {
+        "vendor_sku": vendor_sku,
+        "first_seen": entry['first_seen'],
+        "last_seen": entry['last_seen'],
+        "row_count": entry['row_count'],
+        "cost_count": entry['cost_count'],
+        "min_cost": entry['min_cost'],
+        "max_cost": entry['max_cost'],
+        "last_cost": entry['last_cost'],
+        "series": [{"processed_date": date, "unit_cost": cost} for date, cost in zip(dates, costs)]
+    }
+
+
+@app.get("/history/memory")
+async def get_history_memory():
+    """
+    Memory held by the resident history, per column, before and after compaction
+    """
+    try:
+        return memory_report(get_sheet_history())
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build memory report: {str(e)}")
+
+
 @app.get("/config")
 async def get_config():
     """
@@ -0,0 +1,169 @@
+"""
+Swag Golf Pricing Intelligence Tool - Annotation Backfill
+Recomputes variance_%, variance_flag, supplier_baseline_% and impact_$ (and
+canonical_sku, when enabled) for every row of the Pricing Data sheet, e.g. after
+changing variance_thresholds or fixing a data error, and writes back only the
+cells that changed.
+
+Usage:
+    python backfill.py               Report what would change (dry run)
+    python backfill.py --apply       Write the changed cells to Google Sheets
+    python backfill.py --workers 8   Replay the history in 8 worker processes
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import Dict
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / 'src'))
+
+from config_loader import ConfigLoader
+from sheets_writer import SheetsWriter
+from history_mirror import mirror_from_config
+from main import build_variance_engine, build_state_store
+
+
+def run_backfill(apply_changes: bool = False, workers: int = 1) -> Dict:
+    """
+    Replay the full sheet history through the Variance Engine and sync the results.
+
+    The sheet is re-read in full (it is the system of record), every row is
+    re-annotated as of the moment it was written, and only cells whose value
+    changed are written back. A failed run can simply be repeated: rows that
+    were already updated no longer show up as changed.
+
+    Args:
+        apply_changes: Write changed cells to the sheet (False for a dry run)
+        workers: Worker processes for the replay (default 1)
+
+    Returns:
+        dict: Backfill results with structure:
+            {
+                'success': bool,
+                'total_rows': int,
+                'changed_rows': int,
+                'changed_cells': dict (column -> count),
+                'cells_updated': int,
+                'error': str (if any)
+            }
+    """
+    results = {
+        'success': False,
+        'total_rows': 0,
+        'changed_rows': 0,
+        'changed_cells': {},
+        'cells_updated': 0,
+        'error': None
+    }
+
+    try:
+        config = ConfigLoader()
+        gs_config = config.config.get('google_sheets', {})
+        mirror = mirror_from_config(config)
+
+        writer = SheetsWriter(
+            sheet_id=gs_config.get('sheet_id', ''),
+            credentials_file=gs_config.get('credentials_file', 'credentials.json'),
+            token_file=gs_config.get('token_file', 'token.json'),
+            sheet_name=gs_config.get('sheet_name', 'Pricing Data'),
+            mirror=mirror,
+            canonicalize_skus=config.config.get('variance_engine', {}).get('canonicalize_skus', False)
+        )
+        writer.authenticate()
+
+        # No mirror here: the replay must see exactly what is in the sheet
+        engine = build_variance_engine(config)
+        engine.delta_sync = False
+
+        print(f"\n[DATA] Loading full history from '{writer.sheet_name}'...")
+        history = engine.load_historical_data(writer.service, writer.sheet_id, writer.sheet_name)
+        results['total_rows'] = len(history)
+
+        if history.empty:
+            print("[WARN]  Sheet has no rows to backfill")
+            results['success'] = True
+            return results
+
+        print("\n🧠 Replaying history through the Variance Engine...")
+        backfilled = engine.backfill_annotations(history, workers=workers)
+        changes = engine.changed_annotations(history, backfilled)
+
+        changed_index = set()
+        for column, values in changes.items():
+            results['changed_cells'][column] = len(values)
+            changed_index.update(values.index)
+        results['changed_rows'] = len(changed_index)
+
+        print(f"\n[DATA] {results['changed_rows']} of {len(history)} row(s) changed")
+        for column, count in results['changed_cells'].items():
+            print(f"   {column}: {count} cell(s)")
+
+        if not apply_changes:
+            print("\n[OK] Dry run complete. Re-run with --apply to write the changes.")
+            results['success'] = True
+            return results
+
+        # Adds headers of columns introduced since the sheet was created
+        headers_match, existing_headers = writer._verify_headers()
+        if not headers_match:
+            raise Exception(f"Sheet headers do not match the canonical columns: {existing_headers}")
+
+        # Data rows start on sheet row 2
+        sheet_changes = {
+            column: values.set_axis(history.index.get_indexer(values.index) + 2)
+            for column, values in changes.items()
+        }
+        results['cells_updated'] = writer.update_cells(sheet_changes)
+
+        # Rolling state and mirror hold stored annotations too
+        updated = history.copy()
+        for column in backfilled.columns:
+            updated[column] = backfilled[column]
+
+        state_store = build_state_store(config)
+        state_store.rebuild(updated, writer.sheet_id, writer.sheet_name)
+        state_store.save()
+
+        if mirror is not None:
+            mirror.rebuild(updated, writer.sheet_id, writer.sheet_name)
+
+        print(f"\n[OK] Backfill complete: {results['cells_updated']} cell(s) updated")
+        results['success'] = True
+
+    except Exception as e:
+        print(f"[ERROR] Backfill failed: {e}")
+        results['error'] = str(e)
+
+    return results
+
+
+def main():
+    """
+    Main entry point for command-line execution.
+    """
+    parser = argparse.ArgumentParser(description="Re-annotate the Pricing Data history.")
+    parser.add_argument('--apply', action='store_true',
+                        help="write changed cells to the sheet (default: dry run)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes for the replay (0: one per CPU; default 1)")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("SWAG GOLF PRICING INTELLIGENCE TOOL - BACKFILL")
+    print("=" * 80)
+
+    workers = args.workers if args.workers > 0 else os.cpu_count() or 1
+    results = run_backfill(apply_changes=args.apply, workers=workers)
+    return results['success']
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n\n[WARN]  Backfill interrupted by user")
+        sys.exit(1)
@@ -6,16 +6,22 @@ Processes invoice PDFs and writes pricing data to Google Sheets.
 import sys
 import shutil
 import os
+import time
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent / 'src'))
 
 from config_loader import ConfigLoader
-from invoice_extractor import InvoiceExtractor
+from invoice_extractor import InvoiceExtractor, MAX_CONCURRENT_EXTRACTIONS, PAGES_PER_REQUEST
 from sheets_writer import SheetsWriter
 from variance_engine import VarianceEngine
+from rolling_state import RollingStateStore
+from history_mirror import mirror_from_config
+from analysis_cache import cache_from_config
+from duplicate_index import DuplicateInvoice, duplicate_index_from_config
 
 
 def move_processed_file(pdf_path: Path, processed_dir: Path) -> bool:
@@ -53,10 +59,118 @@ def move_processed_file(pdf_path: Path, processed_dir: Path) -> bool:
         return False
 
 
-def run_pipeline():
+def build_state_store(config: ConfigLoader) -> RollingStateStore:
+    """
+    Create the rolling state store configured under paths.rolling_state.
+
+    Args:
+        config: Loaded configuration
+
+    Returns:
+        RollingStateStore sized like the Variance Engine's windows
+    """
+    state_path = config.config['paths'].get('rolling_state', 'Output/rolling_state.json')
+    return RollingStateStore(state_path, rolling_window=3, supplier_window=30)
+
+
+def build_variance_engine(config: ConfigLoader, state_store=None, mirror=None) -> VarianceEngine:
+    """
+    Create a Variance Engine from the thresholds and variance_engine settings.
+
+    Args:
+        config: Loaded configuration
+        state_store: Optional RollingStateStore
+        mirror: Optional HistoryMirror
+
+    Returns:
+        Configured VarianceEngine
+    """
+    engine_config = config.config.get('variance_engine', {})
+    return VarianceEngine(
+        green_threshold=config.get_variance_threshold('green'),
+        yellow_threshold=config.get_variance_threshold('yellow'),
+        rolling_window=3,
+        supplier_window=30,
+        rolling_days=engine_config.get('rolling_days'),
+        multi_window=engine_config.get('multi_window', False),
+        short_window=engine_config.get('short_window', 3),
+        long_window=engine_config.get('long_window', 12),
+        ewma_span=engine_config.get('ewma_span', 10),
+        robust_scoring=engine_config.get('robust_scoring', False),
+        robust_z_threshold=engine_config.get('robust_z_threshold', 3.5),
+        canonicalize_skus=engine_config.get('canonicalize_skus', False),
+        sku_match_threshold=engine_config.get('sku_match_threshold', 0.8),
+        history_chunk_rows=engine_config.get('history_chunk_rows', 5000),
+        state_store=state_store,
+        mirror=mirror
+    )
+
+
+def add_stage_timing(timings: Dict, stage: str, seconds: float, rows: int) -> None:
+    """
+    Accumulate one stage's wall-clock time and row count into the pipeline timings.
+
+    Args:
+        timings: Pipeline timings dict (results['timings'])
+        stage: Stage name
+        seconds: Time spent in the stage
+        rows: Rows handled by the stage
+    """
+    totals = timings['stages'].setdefault(stage, {'seconds': 0.0, 'rows': 0})
+    totals['seconds'] += seconds
+    totals['rows'] += rows
+
+
+def annotate_invoices(variance_engine: VarianceEngine, writer: SheetsWriter, gs_config: Dict,
+                      extracted: List[Tuple], results: Dict) -> List:
+    """
+    Annotate extracted invoices in order against a single history load.
+
+    Args:
+        variance_engine: Variance engine
+        writer: Authenticated SheetsWriter (its service reads the history)
+        gs_config: google_sheets section of the config
+        extracted: (pdf_path, DataFrame) pairs, in processing order
+        results: Pipeline results; failures and stage timings are recorded here
+
+    Returns:
+        Annotated DataFrames in the order of extracted (empty if annotation failed)
+    """
+    try:
+        annotated = variance_engine.annotate_invoice_batch(
+            [df for _, df in extracted],
+            writer.service,
+            gs_config.get('sheet_id'),
+            gs_config.get('sheet_name')
+        )
+    except Exception as e:
+        print(f"[ERROR] Variance analysis failed: {e}")
+        for pdf_path, _ in extracted:
+            results['failed_files'].append((pdf_path.name, f"Variance analysis failed: {e}"))
+        return []
+
+    for df in annotated:
+        timings = df.attrs.get('timings')
+        if timings:
+            results['timings']['history_rows'] = max(results['timings']['history_rows'],
+                                                     timings['history_rows'])
+            for stage, timing in timings['stages'].items():
+                add_stage_timing(results['timings'], stage, timing['seconds'], timing['rows'])
+
+    return annotated
+
+
+def run_pipeline(extractions: Optional[List[Tuple]] = None):
     """
     Run the complete processing pipeline.
 
+    Args:
+        extractions: Invoices already extracted by the caller, as returned by
+            extract_many (e.g. the backend's AsyncInvoiceExtractor), with a
+            DuplicateInvoice in place of files skipped as already written;
+            None to extract every PDF in Invoices/new here (the extract
+            stage is then timed by the caller)
+
     Returns:
         dict: Processing results with structure:
             {
@@ -64,9 +178,11 @@ def run_pipeline():
                 'total_files': int,
                 'successful_files': list,
                 'failed_files': list,
+                'duplicate_files': list of (filename, reason),
                 'moved_files': list,
                 'total_rows_written': int,
                 'variance_counts': dict,
+                'timings': dict (history_rows, stages -> {'seconds', 'rows'}),
                 'sheet_url': str,
                 'error': str (if any)
             }
@@ -76,9 +192,11 @@ def run_pipeline():
         'total_files': 0,
         'successful_files': [],
         'failed_files': [],
+        'duplicate_files': [],
         'moved_files': [],
         'total_rows_written': 0,
         'variance_counts': {'GREEN': 0, 'YELLOW': 0, 'RED': 0},
+        'timings': {'history_rows': 0, 'stages': {}},
         'sheet_url': '',
         'error': None
     }
@@ -93,28 +211,36 @@ def run_pipeline():
         results['error'] = f"Configuration error: {e}"
         return results
 
-    # Step 2: Initialize Azure Extractor
-    print("[CONNECT] Connecting to Azure Form Recognizer...")
-    try:
-        extractor = InvoiceExtractor(
-            endpoint=config.get_azure_endpoint(),
-            key=config.get_azure_key()
-        )
-        print("[OK] Connected to Azure Form Recognizer\n")
-    except Exception as e:
-        print(f"[ERROR] Azure connection failed: {e}")
-        results['error'] = f"Azure connection failed: {e}"
-        return results
+    # Step 2: Initialize Azure Extractor (unless the caller already extracted)
+    if extractions is None:
+        print("[CONNECT] Connecting to Azure Form Recognizer...")
+        try:
+            azure_config = config.config.get('azure', {})
+            extractor = InvoiceExtractor(
+                endpoint=config.get_azure_endpoint(),
+                key=config.get_azure_key(),
+                cache=cache_from_config(config),
+                max_concurrent=azure_config.get('max_concurrent_extractions', MAX_CONCURRENT_EXTRACTIONS),
+                pages_per_request=azure_config.get('pages_per_request', PAGES_PER_REQUEST)
+            )
+            print("[OK] Connected to Azure Form Recognizer\n")
+        except Exception as e:
+            print(f"[ERROR] Azure connection failed: {e}")
+            results['error'] = f"Azure connection failed: {e}"
+            return results
 
     # Step 3: Initialize Google Sheets Writer
     print("[CONNECT] Connecting to Google Sheets...")
     try:
         gs_config = config.config.get('google_sheets', {})
+        history_mirror = mirror_from_config(config)
         writer = SheetsWriter(
             sheet_id=gs_config.get('sheet_id', ''),
             credentials_file=gs_config.get('credentials_file', 'credentials.json'),
             token_file=gs_config.get('token_file', 'token.json'),
-            sheet_name=gs_config.get('sheet_name', 'Pricing Data')
+            sheet_name=gs_config.get('sheet_name', 'Pricing Data'),
+            mirror=history_mirror,
+            canonicalize_skus=config.config.get('variance_engine', {}).get('canonicalize_skus', False)
         )
         writer.authenticate()
         print("[OK] Connected to Google Sheets\n")
@@ -131,9 +257,25 @@ def run_pipeline():
         results['error'] = f"Google Sheets connection failed: {e}"
         return results
 
+    # Step 3b: Load the invoices already in the sheet, to skip duplicates
+    duplicates = duplicate_index_from_config(config)
+    if duplicates is not None:
+        try:
+            # Forgetting files whose rows left the sheet must stick even if nothing is written
+            if duplicates.load_invoices(writer.invoice_ids()):
+                duplicates.save()
+            print(f"[OK] Duplicate check: {len(duplicates.files)} known file(s), "
+                  f"{len(duplicates.invoices)} invoice(s) in the sheet\n")
+        except Exception as e:
+            print(f"[WARN]  Duplicate check disabled: {e}\n")
+            duplicates = None
+
     # Step 4: Get list of invoices to process
     print("📂 Scanning for invoice PDFs...")
-    pdf_files = config.list_new_invoices()
+    if extractions is None:
+        pdf_files = config.list_new_invoices()
+    else:
+        pdf_files = [pdf_path for pdf_path, _ in extractions]
 
     if not pdf_files:
         print("[WARN]  No PDF files found in Invoices/new/")
@@ -147,11 +289,8 @@ def run_pipeline():
     # Step 4: Initialize Variance Engine
     print("🧠 Initializing Variance Intelligence Engine...")
     try:
-        variance_engine = VarianceEngine(
-            green_threshold=config.get_variance_threshold('green'),
-            yellow_threshold=config.get_variance_threshold('yellow'),
-            rolling_window=3,
-            supplier_window=30
+        variance_engine = build_variance_engine(
+            config, state_store=build_state_store(config), mirror=history_mirror
         )
         print("[OK] Variance Engine initialized\n")
     except Exception as e:
@@ -162,44 +301,82 @@ def run_pipeline():
     # Step 5: Get processed directory path
     processed_dir = config.get_path('invoices_processed')
 
-    # Step 6: Process each invoice
-    for idx, pdf_path in enumerate(pdf_files, 1):
-        print(f"\n{'='*80}")
-        print(f"Processing {idx}/{len(pdf_files)}: {pdf_path.name}")
-        print(f"{'='*80}")
-
+    # Step 6: Extract data from the invoices, several at a time
+    extract_here = extractions is None
+    started = time.perf_counter()
+    if extract_here:
+        max_concurrent = config.config.get('azure', {}).get('max_concurrent_extractions',
+                                                            MAX_CONCURRENT_EXTRACTIONS)
+        to_extract, skipped = pdf_files, []
+        if duplicates is not None:
+            to_extract, skipped = duplicates.split_known_files(pdf_files)
+
+        print(f"\n📄 Extracting {len(to_extract)} invoice(s), up to {max_concurrent} at a time...")
+        by_path = dict(skipped + extractor.extract_many(to_extract, max_workers=max_concurrent))
+        extractions = [(pdf_path, by_path[pdf_path]) for pdf_path in pdf_files]
+
+    extracted = []
+    for pdf_path, df in extractions:
+        if isinstance(df, DuplicateInvoice):
+            print(f"[WARN]  Skipping duplicate {pdf_path.name}: {df}")
+            results['duplicate_files'].append((pdf_path.name, str(df)))
+        elif isinstance(df, Exception):
+            print(f"[ERROR] Error processing {pdf_path.name}: {df}")
+            results['failed_files'].append((pdf_path.name, str(df)))
+            print(f"[ERROR] Skipped moving {pdf_path.name} due to processing failure")
+        elif df.empty:
+            print(f"[WARN]  No data extracted from {pdf_path.name}")
+            results['failed_files'].append((pdf_path.name, "No data extracted"))
+        else:
+            # Drop only the invoices already written; a PDF can hold several
+            if duplicates is not None:
+                df, repeated = duplicates.filter_duplicates(pdf_path, df)
+                for duplicate in repeated:
+                    print(f"[WARN]  Skipping duplicate in {pdf_path.name}: {duplicate}")
+                    results['duplicate_files'].append((pdf_path.name, str(duplicate)))
+            if not df.empty:
+                extracted.append((pdf_path, df))
+
+    if extract_here:
+        add_stage_timing(results['timings'], 'extract', time.perf_counter() - started,
+                         sum(len(df) for _, df in extracted))
+    print(f"[OK] Extracted {len(extracted)} of {len(pdf_files)} invoice(s)")
+
+    # Step 7: Annotate all extracted invoices against a single history load
+    annotated = []
+    if extracted:
+        print(f"\n🧠 Running Variance Intelligence Engine on {len(extracted)} invoice(s)...")
+        annotated = annotate_invoices(variance_engine, writer, gs_config, extracted, results)
+
+    # Step 8: Write each annotated invoice in order
+    pending = list(zip(extracted, annotated))
+    while pending:
+        (pdf_path, _), df = pending.pop(0)
+        written = False
         try:
-            # Extract data from PDF
-            df = extractor.extract_invoice(pdf_path)
-
-            if df.empty:
-                print(f"[WARN]  No data extracted from {pdf_path.name}")
-                results['failed_files'].append((pdf_path.name, "No data extracted"))
-                continue
-
-            # Annotate with variance intelligence
-            print(f"\n🧠 Running Variance Intelligence Engine...")
-            df = variance_engine.annotate_invoice_data(
-                df,
-                writer.service,
-                gs_config.get('sheet_id'),
-                gs_config.get('sheet_name')
-            )
-
             # Count variance flags in this invoice
             for flag in df.get('variance_flag', []):
                 if flag in results['variance_counts']:
                     results['variance_counts'][flag] += 1
 
             # Write to Google Sheets
-            print(f"\n📤 Writing to Google Sheets...")
+            print(f"\n📤 Writing {pdf_path.name} to Google Sheets...")
+            started = time.perf_counter()
             rows_written = writer.append_data(df)
+            add_stage_timing(results['timings'], 'write', time.perf_counter() - started, rows_written)
 
             if rows_written > 0:
+                written = True
+                variance_engine.record_written_rows(df)
                 results['total_rows_written'] += rows_written
                 results['successful_files'].append(pdf_path.name)
                 print(f"[OK] {pdf_path.name} processed successfully")
 
+                # Remember the file before it is moved away
+                if duplicates is not None:
+                    duplicates.record(pdf_path, df)
+                    duplicates.save()
+
                 # Move file to processed directory
                 if move_processed_file(pdf_path, processed_dir):
                     results['moved_files'].append(pdf_path.name)
@@ -211,24 +388,41 @@ def run_pipeline():
             print(f"[ERROR] Error processing {pdf_path.name}: {e}")
             results['failed_files'].append((pdf_path.name, str(e)))
             print(f"[ERROR] Skipped moving {pdf_path.name} due to processing failure")
-            continue
 
-    # Step 7: Summary
+        # Later invoices were annotated with this one as history; annotate them again without it
+        if not written and pending:
+            print(f"\n🧠 Re-running Variance Intelligence Engine on {len(pending)} remaining invoice(s)...")
+            remaining = [extracted_pair for extracted_pair, _ in pending]
+            pending = list(zip(remaining, annotate_invoices(variance_engine, writer, gs_config,
+                                                            remaining, results)))
+
+    # Step 9: Summary
     print("\n" + "=" * 80)
     print("PROCESSING SUMMARY")
     print("=" * 80)
     print(f"Total PDFs processed: {results['total_files']}")
     print(f"Successful: {len(results['successful_files'])}")
     print(f"Failed: {len(results['failed_files'])}")
+    print(f"Duplicates skipped: {len(results['duplicate_files'])}")
     print(f"Total rows written to Google Sheets: {results['total_rows_written']}")
     print(f"[MOVE] Files moved to archive: {len(results['moved_files'])} / {results['total_files']}")
 
+    if results['timings']['stages']:
+        print(f"\n⏱️  Time by stage (history: {results['timings']['history_rows']} rows):")
+        for stage, timing in results['timings']['stages'].items():
+            print(f"   - {stage}: {timing['seconds']:.2f}s ({timing['rows']} rows)")
+
     if results['successful_files']:
         print("\n[OK] Successfully processed:")
         for filename in results['successful_files']:
             moved_status = "→ Archived" if filename in results['moved_files'] else ""
             print(f"   - {filename} {moved_status}")
 
+    if results['duplicate_files']:
+        print("\n[WARN]  Skipped as duplicates:")
+        for filename, reason in results['duplicate_files']:
+            print(f"   - {filename}: {reason}")
+
     if results['failed_files']:
         print("\n[ERROR] Failed to process (kept in Invoices/new/):")
         for filename, error in results['failed_files']:
@@ -236,7 +430,9 @@ def run_pipeline():
 
     print("\n" + "=" * 80)
 
-    results['success'] = len(results['successful_files']) > 0
+    # A run that only found duplicates has nothing left to do
+    results['success'] = len(results['successful_files']) > 0 or (
+        len(results['duplicate_files']) > 0 and not results['failed_files'])
     return results
 
 
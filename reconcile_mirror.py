@@ -0,0 +1,69 @@
+"""
+Swag Golf Pricing Intelligence Tool - History Mirror Reconciliation
+Re-syncs the local history mirror from the Pricing Data Google Sheet.
+
+Run after editing the sheet by hand; rows appended by the pipeline are
+mirrored automatically.
+"""
+
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / 'src'))
+
+from config_loader import ConfigLoader
+from sheets_writer import SheetsWriter
+from variance_engine import VarianceEngine
+from history_mirror import mirror_from_config
+from history_cache import history_cache
+
+
+def reconcile_mirror() -> bool:
+    """
+    Download the full sheet history and rebuild the history mirror from it.
+
+    Returns:
+        True if the mirror was reconciled, False otherwise
+    """
+    config = ConfigLoader()
+    mirror = mirror_from_config(config)
+
+    if mirror is None:
+        print("[ERROR] No history mirror configured (paths.history_mirror in config.json)")
+        return False
+
+    gs_config = config.config.get('google_sheets', {})
+    writer = SheetsWriter(
+        sheet_id=gs_config.get('sheet_id', ''),
+        credentials_file=gs_config.get('credentials_file', 'credentials.json'),
+        token_file=gs_config.get('token_file', 'token.json'),
+        sheet_name=gs_config.get('sheet_name', 'Pricing Data')
+    )
+    writer.authenticate()
+
+    print(f"[DATA] Loading full history from '{writer.sheet_name}'...")
+    historical_df = VarianceEngine(delta_sync=False).load_historical_data(
+        writer.service, writer.sheet_id, writer.sheet_name
+    )
+
+    # Anchor the mirror on the last row as it was read, so later edits are noticed
+    base = history_cache.get_base(writer.sheet_id, writer.sheet_name)
+    anchor = {'row': base[1]['rows'], 'values': base[1]['last_row']} if base is not None else None
+
+    summary = mirror.reconcile(historical_df, writer.sheet_id, writer.sheet_name, anchor)
+
+    print(f"\n[OK] Mirror reconciled with {summary['sheet_rows']} sheet row(s)")
+    print(f"   Added:   {summary['added']}")
+    print(f"   Removed: {summary['removed']}")
+    print(f"   Changed: {summary['changed']}")
+
+    return True
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(0 if reconcile_mirror() else 1)
+    except Exception as e:
+        print(f"\n[ERROR] Reconciliation failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,253 @@
+"""
+Analysis Cache for Swag Golf Pricing Intelligence Tool
+Content-addressed on-disk cache of Azure Form Recognizer results, so a PDF that
+was already analyzed (a re-upload, or a retry after a Sheets write failure) is
+extracted again without a new Azure call.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import uuid
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import Dict, Optional
+
+from azure.ai.formrecognizer import AnalyzeResult
+
+
+# Default size cap of the cache directory
+DEFAULT_MAX_MB = 512
+
+# Suffix of cache entries
+ENTRY_SUFFIX = '.json.gz'
+
+
+def analysis_key(document: bytes, model_id: str, pages: Optional[str] = None) -> str:
+    """
+    Cache key of one document (or page range of it) analyzed by one model.
+
+    Args:
+        document: Raw PDF bytes
+        model_id: Azure model ID (e.g. 'prebuilt-invoice')
+        pages: Page range analyzed (e.g. '11-20'), None for the whole document
+
+    Returns:
+        Hex SHA-256 of the model ID, page range and document bytes
+    """
+    prefix = model_id if pages is None else f"{model_id}\0pages={pages}"
+    digest = hashlib.sha256(prefix.encode('utf-8') + b'\0')
+    digest.update(document)
+    return digest.hexdigest()
+
+
+def _encode_value(value):
+    """JSON encoder for the date/time field values left in AnalyzeResult.to_dict()."""
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _restore_field(field) -> None:
+    """Turn ISO strings of date and time fields back into date/time values, recursively."""
+    if field is None:
+        return
+    if field.value_type == 'date' and isinstance(field.value, str):
+        field.value = date.fromisoformat(field.value)
+    elif field.value_type == 'time' and isinstance(field.value, str):
+        field.value = time.fromisoformat(field.value)
+    elif field.value_type == 'list' and field.value:
+        for item in field.value:
+            _restore_field(item)
+    elif field.value_type == 'dictionary' and field.value:
+        for item in field.value.values():
+            _restore_field(item)
+
+
+class AnalysisCache:
+    """
+    Stores raw AnalyzeResults as gzip-compressed JSON, one file per key.
+
+    Entries are keyed by the SHA-256 of the PDF bytes plus the model ID (and
+    the page range of a split document), so a renamed file still hits and a
+    different model never does. A file's modification time is its last use:
+    hits touch it, and when the directory grows past max_bytes the least
+    recently used entries are deleted.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory holding the cache entries (created if missing)
+            max_bytes: Size cap of all entries together
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, key: str) -> Path:
+        """Path of the entry for a key."""
+        return self.cache_dir / f"{key}{ENTRY_SUFFIX}"
+
+    def get(self, document: bytes, model_id: str, pages: Optional[str] = None) -> Optional[AnalyzeResult]:
+        """
+        Look up the analysis of a document.
+
+        Args:
+            document: Raw PDF bytes
+            model_id: Azure model ID
+            pages: Page range analyzed, None for the whole document
+
+        Returns:
+            Cached AnalyzeResult, or None on a miss (or an unreadable entry)
+        """
+        path = self._entry_path(analysis_key(document, model_id, pages))
+
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                result = AnalyzeResult.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"[WARN]  Ignoring unreadable analysis cache entry {path.name}: {e}")
+            return None
+
+        for document_result in result.documents or []:
+            for field in (document_result.fields or {}).values():
+                _restore_field(field)
+
+        # Mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return result
+
+    def put(self, document: bytes, model_id: str, result: AnalyzeResult,
+            pages: Optional[str] = None) -> None:
+        """
+        Store the analysis of a document, then evict down to the size cap.
+
+        Args:
+            document: Raw PDF bytes
+            model_id: Azure model ID
+            result: Result of analyzing document with model_id
+            pages: Page range analyzed, None for the whole document
+        """
+        path = self._entry_path(analysis_key(document, model_id, pages))
+
+        # Write then rename, so concurrent extractions never read a partial entry
+        temp_path = path.with_name(f".{uuid.uuid4().hex}.tmp")
+        try:
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                json.dump(result.to_dict(), f, default=_encode_value)
+            os.replace(temp_path, path)
+        except Exception as e:
+            temp_path.unlink(missing_ok=True)
+            print(f"[WARN]  Could not cache analysis: {e}")
+            return
+
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Delete least recently used entries until the cache fits max_bytes.
+
+        Returns:
+            Number of entries deleted
+        """
+        entries = []
+        for path in self.cache_dir.glob(f"*{ENTRY_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        deleted = 0
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            deleted += 1
+
+        return deleted
+
+    def stats(self) -> Dict:
+        """
+        Size of the cache.
+
+        Returns:
+            dict with entries, total_bytes and max_bytes
+        """
+        sizes = [path.stat().st_size for path in self.cache_dir.glob(f"*{ENTRY_SUFFIX}")]
+        return {'entries': len(sizes), 'total_bytes': sum(sizes), 'max_bytes': self.max_bytes}
+
+
+def cache_from_config(config) -> Optional[AnalysisCache]:
+    """
+    Build the analysis cache configured under paths.analysis_cache.
+
+    Args:
+        config: ConfigLoader instance
+
+    Returns:
+        AnalysisCache capped at azure.analysis_cache_max_mb, or None when no cache is configured
+    """
+    path = config.config.get('paths', {}).get('analysis_cache')
+    if not path:
+        return None
+    max_mb = config.config.get('azure', {}).get('analysis_cache_max_mb', DEFAULT_MAX_MB)
+    return AnalysisCache(path, max_bytes=int(max_mb * 1024 * 1024))
+
+
+def test_analysis_cache():
+    """Test that results round-trip through the cache and old entries are evicted."""
+    import tempfile
+    from azure.ai.formrecognizer import AnalyzedDocument, CurrencyValue, DocumentField
+
+    print("=" * 80)
+    print("ANALYSIS CACHE TEST")
+    print("=" * 80)
+
+    fields = {
+        'VendorName': DocumentField(value_type='string', value='Acme Golf'),
+        'InvoiceDate': DocumentField(value_type='date', value=date(2024, 3, 1)),
+        'Items': DocumentField(value_type='list', value=[DocumentField(value_type='dictionary', value={
+            'UnitPrice': DocumentField(value_type='currency', value=CurrencyValue(amount=1.5, symbol='$')),
+        })]),
+    }
+    result = AnalyzeResult(model_id='prebuilt-invoice', content='invoice',
+                           documents=[AnalyzedDocument(doc_type='invoice', fields=fields)])
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = AnalysisCache(cache_dir)
+        assert cache.get(b'%PDF-1', 'prebuilt-invoice') is None
+
+        cache.put(b'%PDF-1', 'prebuilt-invoice', result)
+        cached = cache.get(b'%PDF-1', 'prebuilt-invoice')
+        cached_fields = cached.documents[0].fields
+        assert cached_fields['InvoiceDate'].value == date(2024, 3, 1)
+        assert cached_fields['Items'].value[0].value['UnitPrice'].value.amount == 1.5
+        assert cache.get(b'%PDF-1', 'prebuilt-layout') is None
+        print(f"\n[OK] Round trip: {cache.stats()}")
+
+        # A cap below two entries keeps only the most recent one
+        cache.max_bytes = cache.stats()['total_bytes'] + 1
+        os.utime(cache._entry_path(analysis_key(b'%PDF-1', 'prebuilt-invoice')), (0, 0))
+        cache.put(b'%PDF-2', 'prebuilt-invoice', result)
+        assert cache.get(b'%PDF-1', 'prebuilt-invoice') is None
+        assert cache.get(b'%PDF-2', 'prebuilt-invoice') is not None
+        print(f"[OK] Eviction: {cache.stats()}")
+
+    print("\n[OK] Test complete")
+
+
+if __name__ == "__main__":
+    test_analysis_cache()
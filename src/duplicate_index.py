@@ -0,0 +1,316 @@
+"""
+Duplicate Index for Swag Golf Pricing Intelligence Tool
+Remembers which invoices are already in the Pricing Data sheet, by PDF content
+hash and by (supplier, invoice_number), so the pipeline can skip a file before
+paying for its Azure analysis and skip an invoice before appending its rows twice.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+
+# Bump when the index layout changes
+INDEX_VERSION = 2
+
+
+class DuplicateInvoice(Exception):
+    """Reported (or returned in place of extracted rows) for an invoice that is already in the sheet."""
+
+
+def file_hash(pdf_path: Path) -> str:
+    """
+    SHA-256 of a file's bytes.
+
+    Args:
+        pdf_path: Path to PDF file
+
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def invoice_key(supplier, invoice_number) -> Optional[Tuple[str, str]]:
+    """
+    Normalized identity of an invoice.
+
+    Args:
+        supplier: Supplier name (None/NaN for missing)
+        invoice_number: Invoice identifier (None/NaN for missing)
+
+    Returns:
+        (supplier, invoice_number) with case and whitespace normalized, or None
+        when there is no invoice number to go by
+    """
+    if invoice_number is None or pd.isna(invoice_number) or not str(invoice_number).strip():
+        return None
+    supplier = '' if supplier is None or pd.isna(supplier) else ' '.join(str(supplier).split()).casefold()
+    return supplier, ''.join(str(invoice_number).split()).upper()
+
+
+class DuplicateIndex:
+    """
+    Content hashes of PDFs already written, plus the invoice IDs in the sheet.
+
+    The hashes are only known locally, so they are saved to disk together with
+    the invoice IDs each file held. The invoice IDs in the sheet are reloaded
+    (from the sheet or a synced mirror) on every run, and a file whose invoices
+    are no longer all in the sheet is forgotten, so rows deleted from the sheet
+    can be processed again. Files without invoice numbers cannot be checked
+    this way and stay recorded.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize an empty index.
+
+        Args:
+            path: JSON file holding the recorded file hashes
+        """
+        self.path = Path(path)
+        self.files: Dict[str, Dict] = {}
+        self.invoices: Set[Tuple[str, str]] = set()
+
+        # Invoices accepted in this run but not written yet
+        self.pending: Set[Tuple[str, str]] = set()
+
+        # Every invoice key extracted from each file in this run, duplicates included
+        self.file_invoices: Dict[Path, Set[Tuple[str, str]]] = {}
+
+    def load(self) -> bool:
+        """
+        Load the recorded file hashes from disk.
+
+        Returns:
+            True if an index file was loaded
+        """
+        if not self.path.exists():
+            return False
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[WARN]  Could not read duplicate index {self.path}: {e}")
+            return False
+
+        if index.get('version') != INDEX_VERSION:
+            return False
+
+        self.files = index.get('files', {})
+        return True
+
+    def save(self) -> None:
+        """Write the recorded file hashes to disk (atomically, via a temporary file)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'files': self.files}, f)
+        tmp_path.replace(self.path)
+
+    def load_invoices(self, pairs: Iterable[Tuple]) -> int:
+        """
+        Replace the known invoice IDs with those currently in the sheet, and
+        forget files with an invoice that is no longer there.
+
+        Args:
+            pairs: (supplier, invoice_number) of every sheet row
+
+        Returns:
+            Number of recorded files forgotten
+        """
+        self.invoices = {key for key in (invoice_key(*pair) for pair in pairs) if key is not None}
+        self.pending = set()
+        self.file_invoices = {}
+
+        stale = [digest for digest, entry in self.files.items()
+                 if any(tuple(key) not in self.invoices for key in entry['invoices'])]
+        for digest in stale:
+            del self.files[digest]
+        return len(stale)
+
+    def split_known_files(self, pdf_paths: List[Path]) -> Tuple[List[Path], List[Tuple[Path, DuplicateInvoice]]]:
+        """
+        Separate PDFs whose exact bytes were already written, or appear earlier in the batch.
+
+        Args:
+            pdf_paths: PDF files about to be extracted
+
+        Returns:
+            (new PDF paths, [(pdf_path, DuplicateInvoice)] for the skipped ones)
+        """
+        new_paths = []
+        skipped = []
+        batch: Dict[str, Path] = {}
+
+        for pdf_path in pdf_paths:
+            digest = file_hash(pdf_path)
+            entry = self.files.get(digest)
+            if entry is not None:
+                numbers = ', '.join(entry['invoice_numbers']) or 'no invoice number'
+                skipped.append((pdf_path, DuplicateInvoice(
+                    f"same file as {entry['source_file']} ({numbers}), written {entry['recorded']}"
+                )))
+            elif digest in batch:
+                skipped.append((pdf_path, DuplicateInvoice(f"same file as {batch[digest].name}")))
+            else:
+                batch[digest] = pdf_path
+                new_paths.append(pdf_path)
+
+        return new_paths, skipped
+
+    def filter_duplicates(self, pdf_path: Path, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[DuplicateInvoice]]:
+        """
+        Drop the rows of invoices already in the sheet or earlier in this run, and claim the rest.
+
+        A PDF can hold several invoices, so each invoice is checked on its own.
+        Rows without an invoice number cannot be checked and are kept.
+
+        Args:
+            pdf_path: Source PDF
+            df: Extracted line items (supplier, invoice_number)
+
+        Returns:
+            (rows of new invoices, DuplicateInvoice per repeated invoice)
+        """
+        row_keys = self._row_keys(df)
+        self.file_invoices[pdf_path] = {key for key in row_keys if key is not None}
+
+        duplicates = []
+        repeated = set()
+        for key, (supplier, invoice_number) in self._invoice_keys(df).items():
+            invoice = f"invoice {invoice_number} from {supplier or 'unknown supplier'}"
+            if key in self.invoices:
+                duplicates.append(DuplicateInvoice(f"{invoice} is already in the sheet"))
+            elif key in self.pending:
+                duplicates.append(DuplicateInvoice(f"{invoice} appears earlier in this batch"))
+            else:
+                continue
+            repeated.add(key)
+
+        self.pending.update(self.file_invoices[pdf_path] - repeated)
+        if not repeated:
+            return df, duplicates
+        return df[[key not in repeated for key in row_keys]], duplicates
+
+    def record(self, pdf_path: Path, df: pd.DataFrame) -> None:
+        """
+        Record a file whose new invoices were written to the sheet.
+
+        Args:
+            pdf_path: Source PDF (still at its original path)
+            df: Rows written for it
+        """
+        keys = self._invoice_keys(df)
+        self.invoices.update(keys)
+        self.pending.difference_update(keys)
+
+        # The file's skipped invoices are in the sheet too; all of them must stay there
+        file_keys = self.file_invoices.pop(pdf_path, set()) | set(keys)
+        self.files[file_hash(pdf_path)] = {
+            'source_file': pdf_path.name,
+            'invoices': sorted(list(key) for key in file_keys),
+            'invoice_numbers': [str(number) for _, number in keys.values()],
+            'recorded': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+    @staticmethod
+    def _row_keys(df: pd.DataFrame) -> List[Optional[Tuple[str, str]]]:
+        """Invoice key of every row (None where there is no invoice number)."""
+        if df.empty or 'invoice_number' not in df.columns:
+            return [None] * len(df)
+        suppliers = df['supplier'] if 'supplier' in df.columns else [None] * len(df)
+        return [invoice_key(supplier, number) for supplier, number in zip(suppliers, df['invoice_number'])]
+
+    @staticmethod
+    def _invoice_keys(df: pd.DataFrame) -> Dict[Tuple[str, str], Tuple]:
+        """Distinct invoice keys of a DataFrame's rows, mapped to the first (supplier, invoice_number) as written."""
+        if df.empty or 'invoice_number' not in df.columns:
+            return {}
+        suppliers = df['supplier'] if 'supplier' in df.columns else [None] * len(df)
+        keys = {}
+        for supplier, number in zip(suppliers, df['invoice_number']):
+            key = invoice_key(supplier, number)
+            if key is not None:
+                keys.setdefault(key, (supplier, number))
+        return keys
+
+
+def duplicate_index_from_config(config) -> Optional[DuplicateIndex]:
+    """
+    Build and load the duplicate index configured under paths.duplicate_index.
+
+    Args:
+        config: ConfigLoader instance
+
+    Returns:
+        DuplicateIndex, or None when duplicate checks are not configured
+    """
+    path = config.config.get('paths', {}).get('duplicate_index')
+    if not path:
+        return None
+    index = DuplicateIndex(path)
+    index.load()
+    return index
+
+
+def test_duplicate_index():
+    """Test file-hash and invoice-ID duplicate detection."""
+    import tempfile
+
+    print("=" * 80)
+    print("DUPLICATE INDEX TEST")
+    print("=" * 80)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for name, content in [('a.pdf', b'%PDF A'), ('a_copy.pdf', b'%PDF A'), ('b.pdf', b'%PDF B')]:
+            (tmp / name).write_bytes(content)
+
+        # a.pdf holds two invoices; b.pdf repeats one of them next to a new one
+        file_a = pd.DataFrame({'supplier': ['Acme Golf', 'Acme Golf'], 'invoice_number': ['INV-1', 'INV-2']})
+        file_b = pd.DataFrame({'supplier': ['ACME  golf', 'Acme Golf'], 'invoice_number': ['inv-1 ', 'INV-3']})
+
+        index = DuplicateIndex(str(tmp / 'duplicate_index.json'))
+        index.load_invoices([('Other', 'INV-9')])
+
+        new_paths, skipped = index.split_known_files([tmp / 'a.pdf', tmp / 'a_copy.pdf'])
+        assert new_paths == [tmp / 'a.pdf'] and skipped[0][0] == tmp / 'a_copy.pdf'
+        print(f"\n[OK] Same bytes in one batch: {skipped[0][1]}")
+
+        kept, duplicates = index.filter_duplicates(tmp / 'a.pdf', file_a)
+        assert len(kept) == 2 and not duplicates
+        index.record(tmp / 'a.pdf', kept)
+        index.save()
+
+        reloaded = DuplicateIndex(str(tmp / 'duplicate_index.json'))
+        assert reloaded.load()
+        assert reloaded.load_invoices([('Acme Golf', 'INV-1'), ('Acme Golf', 'INV-2')]) == 0
+        new_paths, skipped = reloaded.split_known_files([tmp / 'a_copy.pdf', tmp / 'b.pdf'])
+        assert new_paths == [tmp / 'b.pdf']
+        print(f"[OK] Known file: {skipped[0][1]}")
+
+        kept, duplicates = reloaded.filter_duplicates(tmp / 'b.pdf', file_b)
+        assert list(kept['invoice_number']) == ['INV-3'] and len(duplicates) == 1
+        print(f"[OK] Known invoice dropped, new one kept: {duplicates[0]}")
+
+        # Deleting INV-2 from the sheet makes a.pdf's bytes processable again
+        assert reloaded.load_invoices([('Acme Golf', 'INV-1')]) == 1
+        new_paths, _ = reloaded.split_known_files([tmp / 'a_copy.pdf'])
+        assert new_paths == [tmp / 'a_copy.pdf']
+        print("[OK] File forgotten once its rows left the sheet")
+
+    print("\n[OK] Test complete")
+
+
+if __name__ == "__main__":
+    test_duplicate_index()
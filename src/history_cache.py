@@ -0,0 +1,283 @@
+"""
+History Cache for Swag Golf Pricing Intelligence Tool
+Shares the parsed Pricing Data history between the Variance Engine, the FastAPI
+backend and the Streamlit UI so the sheet is parsed at most once per change.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    TEXT_DTYPE = 'string[pyarrow]'  # Arrow-backed strings: one buffer instead of a PyObject per cell
+except ImportError:
+    TEXT_DTYPE = 'string'
+
+
+# Seconds a cached history stays valid without an explicit invalidation
+DEFAULT_TTL_SECONDS = 300
+
+# Repeating text columns stored as categoricals by compact_history
+CATEGORY_COLUMNS = ['vendor_sku', 'supplier', 'invoice_number', 'invoice_date',
+                    'variance_flag', 'source_file', 'canonical_sku']
+
+# Numeric columns stored as float32 by compact_history. variance_% and impact_$
+# stay float64: threshold simulation must flag exactly like assign_variance_flags
+FLOAT32_COLUMNS = ['quantity', 'unit_cost', 'total_cost', 'supplier_baseline_%']
+
+
+class HistoryCache:
+    """
+    Versioned in-process cache of historical DataFrames keyed by (sheet_id, sheet_name).
+
+    Every invalidation bumps the key's version. A load only populates the cache
+    if the version did not change while it was running, so a write that lands
+    mid-download never leaves a stale frame behind.
+
+    Outdated entries are kept (but never served by get) so a delta sync can
+    extend them with only the rows appended since they were loaded.
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        """
+        Initialize history cache.
+
+        Args:
+            ttl_seconds: Maximum age of a cached history in seconds (default 300)
+        """
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Tuple[str, str], Tuple[int, float, pd.DataFrame, Optional[Dict]]] = {}
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def version(self, sheet_id: str, sheet_name: str) -> int:
+        """
+        Get the current version of a sheet tab (incremented on every invalidation).
+
+        Args:
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+
+        Returns:
+            Version number
+        """
+        with self._lock:
+            return self._versions.get((sheet_id, sheet_name), 0)
+
+    def get(self, sheet_id: str, sheet_name: str) -> Optional[pd.DataFrame]:
+        """
+        Get the cached history if it is current and within the TTL.
+
+        Args:
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+
+        Returns:
+            Shallow copy of the cached DataFrame, or None on a miss
+        """
+        key = (sheet_id, sheet_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            version, loaded_at, df, _ = entry
+            if (version != self._versions.get(key, 0) or
+                    time.monotonic() - loaded_at > self.ttl_seconds):
+                return None
+
+        # Callers may add columns freely but must not modify values in place
+        return df.copy(deep=False)
+
+    def get_base(self, sheet_id: str, sheet_name: str) -> Optional[Tuple[pd.DataFrame, Dict[str, Any]]]:
+        """
+        Get the most recently loaded history and its sync metadata, even if outdated.
+
+        Args:
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+
+        Returns:
+            Tuple of (DataFrame, metadata), or None if nothing with metadata was cached
+        """
+        with self._lock:
+            entry = self._entries.get((sheet_id, sheet_name))
+
+        if entry is None or entry[3] is None:
+            return None
+        return entry[2], entry[3]
+
+    def put(self, sheet_id: str, sheet_name: str, df: pd.DataFrame,
+            version: Optional[int] = None, meta: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Store a history DataFrame.
+
+        Args:
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+            df: Parsed history
+            version: Version the frame was loaded at; ignored if it is outdated
+            meta: Optional sync metadata (headers, row count, last raw row)
+        """
+        key = (sheet_id, sheet_name)
+        with self._lock:
+            current = self._versions.get(key, 0)
+            if version is not None and version != current:
+                return
+            self._entries[key] = (current, time.monotonic(), df, meta)
+
+    def get_or_load(self, sheet_id: str, sheet_name: str,
+                    loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Return the cached history, calling loader() to populate it on a miss.
+
+        Args:
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+            loader: Function that downloads and parses the history
+
+        Returns:
+            Historical DataFrame
+        """
+        df = self.get(sheet_id, sheet_name)
+        if df is not None:
+            print(f"[CACHE] Using cached history ({len(df)} rows)")
+            return df
+
+        version = self.version(sheet_id, sheet_name)
+        df = loader()
+
+        # The loader may already have cached the frame (with sync metadata)
+        if self.get(sheet_id, sheet_name) is None:
+            self.put(sheet_id, sheet_name, df, version)
+        return df.copy(deep=False)
+
+    def invalidate(self, sheet_id: str, sheet_name: Optional[str] = None) -> None:
+        """
+        Mark cached history as outdated after the sheet changed.
+
+        Args:
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name (None invalidates every tab of the spreadsheet)
+        """
+        with self._lock:
+            keys = {key for key in list(self._entries) + list(self._versions)
+                    if key[0] == sheet_id and (sheet_name is None or key[1] == sheet_name)}
+            if sheet_name is not None:
+                keys.add((sheet_id, sheet_name))
+
+            # Entries stay behind as delta-sync bases; the version bump hides them
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def clear(self) -> None:
+        """Drop every cached history."""
+        with self._lock:
+            for key in self._entries:
+                self._versions[key] = self._versions.get(key, 0) + 1
+            self._entries.clear()
+
+
+def compact_history(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a parsed history to a compact, read-only representation.
+
+    Repeating text columns become categoricals, other text columns Arrow-backed
+    strings (when pyarrow is installed) and the FLOAT32_COLUMNS float32. float32
+    keeps about 7 significant digits, enough for display but not for the
+    Variance Engine, which needs the parsed frame.
+
+    Args:
+        df: Parsed history DataFrame
+
+    Returns:
+        Compact copy; attrs['source_bytes'] holds the original frame's size
+    """
+    source_bytes = int(df.memory_usage(deep=True).sum())
+    compact = df.copy()
+
+    for column in compact.columns:
+        if column in FLOAT32_COLUMNS:
+            compact[column] = pd.to_numeric(compact[column], errors='coerce').astype('float32')
+        elif column in CATEGORY_COLUMNS:
+            compact[column] = compact[column].astype('category')
+        elif compact[column].dtype == object:
+            compact[column] = compact[column].astype(TEXT_DTYPE)
+
+    compact.attrs['source_bytes'] = source_bytes
+    return compact
+
+
+def memory_report(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Report the memory held by a history DataFrame, per column.
+
+    Args:
+        df: History DataFrame (parsed or compact)
+
+    Returns:
+        dict: Report with structure:
+            {
+                'rows': int,
+                'total_bytes': int,
+                'source_bytes': int (size before compaction, if compacted),
+                'columns': dict (column -> {'dtype': str, 'bytes': int})
+            }
+    """
+    usage = df.memory_usage(deep=True, index=False)
+    report = {
+        'rows': len(df),
+        'total_bytes': int(usage.sum()),
+        'columns': {column: {'dtype': str(df[column].dtype), 'bytes': int(usage[column])}
+                    for column in df.columns}
+    }
+    if 'source_bytes' in df.attrs:
+        report['source_bytes'] = df.attrs['source_bytes']
+    return report
+
+
+def history_records(df: pd.DataFrame, limit: Optional[int] = None) -> List[Dict[str, str]]:
+    """
+    Convert the last rows of a parsed history back to sheet-style string records.
+
+    Numbers are rendered the way SheetsWriter writes them, dates as
+    '%Y-%m-%d %H:%M:%S' and missing values as empty strings.
+
+    Args:
+        df: Parsed history DataFrame
+        limit: Number of most recent rows to return (None for all)
+
+    Returns:
+        List of dictionaries keyed by column name
+    """
+    if df.empty:
+        return []
+
+    rows = df.tail(limit) if limit else df
+    records = []
+
+    # float32 columns of a compact history would read back as widened Python floats
+    narrow = [column for column in rows.columns if rows[column].dtype == 'float32']
+    if narrow:
+        rows = rows.assign(**{column: rows[column].astype(str).where(rows[column].notna())
+                              for column in narrow})
+
+    for row in rows.itertuples(index=False, name=None):
+        record = {}
+        for column, value in zip(rows.columns, row):
+            if value is None or (not isinstance(value, str) and pd.isna(value)):
+                record[column] = ''
+            elif isinstance(value, pd.Timestamp):
+                record[column] = value.strftime('%Y-%m-%d %H:%M:%S')
+            else:
+                record[column] = str(value)
+        records.append(record)
+
+    return records
+
+
+# Shared cache for the whole process
+history_cache = HistoryCache()
@@ -0,0 +1,660 @@
+"""
+History Mirror for Swag Golf Pricing Intelligence Tool
+Keeps a local SQLite copy of the Pricing Data rows so the Variance Engine and
+the dashboards can read history without a Google Sheets round trip.
+
+The sheet stays the system of record. SheetsWriter writes every appended row
+to the mirror as well, and reconcile_mirror.py re-syncs the mirror from the
+sheet after manual edits. A materialized sku_history table keeps each SKU's
+price series and summary, so per-SKU reads are a single primary-key lookup.
+"""
+
+import json
+import sqlite3
+from collections import deque
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from rolling_state import RollingStateStore, SupplierBaselines, count_sheet_rows, read_sheet_rows
+from sheets_writer import CANONICAL_SKU_COLUMNS, COLUMNS, NUMERIC_COLUMNS
+
+
+# Bump when the table layout changes; older mirrors are rebuilt from the sheet
+MIRROR_VERSION = 3
+
+# Columns of the materialized per-SKU table (costs/dates are packed arrays)
+SKU_COLUMNS = ['vendor_sku', 'first_seen', 'last_seen', 'row_count', 'cost_count',
+               'min_cost', 'max_cost', 'last_cost', 'costs', 'dates']
+
+# SQLite's default limit on bound parameters per statement is 999
+SQL_BATCH = 500
+
+# Table columns; a sheet without canonical_sku is stored with it blank and
+# read back without it (mirror_meta 'columns' holds the sheet's column count)
+MIRROR_COLUMNS = CANONICAL_SKU_COLUMNS
+
+# Columns with a lookup index
+INDEXED_COLUMNS = ['vendor_sku', 'supplier', 'processed_date']
+
+
+def _quote(column: str) -> str:
+    """Quote a column name for SQL (names contain % and $)."""
+    return '"' + column.replace('"', '""') + '"'
+
+
+def sku_entry(costs: np.ndarray, dates: np.ndarray) -> Dict:
+    """
+    Summarize one SKU's price series.
+
+    Args:
+        costs: float64 unit costs in engine order (NaN where a row has none)
+        dates: datetime64[s] processed dates aligned with costs (NaT if unknown)
+
+    Returns:
+        Dictionary with first_seen, last_seen, row_count, cost_count,
+        min_cost, max_cost, last_cost, costs and dates
+    """
+    priced = costs[~np.isnan(costs)]
+    known = dates[~np.isnat(dates)]
+
+    def date_text(value) -> str:
+        return np.datetime_as_string(value, unit='s').replace('T', ' ')
+
+    return {
+        'first_seen': date_text(known.min()) if len(known) else None,
+        'last_seen': date_text(known.max()) if len(known) else None,
+        'row_count': len(costs),
+        'cost_count': len(priced),
+        'min_cost': float(priced.min()) if len(priced) else None,
+        'max_cost': float(priced.max()) if len(priced) else None,
+        'last_cost': float(priced[-1]) if len(priced) else None,
+        'costs': costs,
+        'dates': dates
+    }
+
+
+def sku_entries(historical_df: pd.DataFrame) -> Dict[str, Dict]:
+    """
+    Build every SKU's price series from a history frame.
+
+    Rows are ordered like the Variance Engine orders history (stable sort on
+    processed_date); rows without a vendor_sku are skipped.
+
+    Args:
+        historical_df: History with vendor_sku, unit_cost and processed_date
+
+    Returns:
+        Dictionary mapping vendor_sku to its sku_entry
+    """
+    history = pd.DataFrame({
+        'vendor_sku': historical_df['vendor_sku'].fillna('').astype(str),
+        'unit_cost': pd.to_numeric(historical_df['unit_cost'], errors='coerce'),
+        'processed_date': pd.to_datetime(historical_df['processed_date'], errors='coerce')
+    })
+    history = history[history['vendor_sku'] != '']
+    history = history.sort_values('processed_date', kind='mergesort')
+
+    return {
+        sku: sku_entry(group['unit_cost'].to_numpy(dtype=float),
+                       group['processed_date'].to_numpy(dtype='datetime64[s]'))
+        for sku, group in history.groupby('vendor_sku', sort=False)
+    }
+
+
+class HistoryMirror:
+    """
+    SQLite mirror of one Pricing Data tab, keyed by sheet row number.
+
+    Numeric columns are stored as REAL, processed_date as ISO text and everything
+    else as the text written to the sheet, so load_history() returns the same
+    frame VarianceEngine parses from the sheet itself.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize history mirror.
+
+        Args:
+            path: SQLite database file (created on first use)
+        """
+        self.path = Path(path)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection, creating the schema if needed."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        self._create_schema(conn)
+
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        """Create the tables and indexes that do not exist yet."""
+        column_defs = ', '.join(
+            f"{_quote(col)} {'REAL' if col in NUMERIC_COLUMNS else 'TEXT'}" for col in MIRROR_COLUMNS
+        )
+        conn.execute(f"CREATE TABLE IF NOT EXISTS pricing_data "
+                     f"(sheet_row INTEGER PRIMARY KEY, {column_defs})")
+        for col in INDEXED_COLUMNS:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_pricing_{col} "
+                         f"ON pricing_data ({_quote(col)})")
+        conn.execute("CREATE TABLE IF NOT EXISTS mirror_meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS sku_history "
+                     "(vendor_sku TEXT PRIMARY KEY, first_seen TEXT, last_seen TEXT, "
+                     "row_count INTEGER, cost_count INTEGER, min_cost REAL, max_cost REAL, "
+                     "last_cost REAL, costs BLOB, dates BLOB)")
+
+    def _get_meta(self, conn: sqlite3.Connection) -> Dict[str, str]:
+        """Read the metadata table into a dictionary."""
+        return dict(conn.execute("SELECT key, value FROM mirror_meta").fetchall())
+
+    def _set_meta(self, conn: sqlite3.Connection, **values) -> None:
+        """Upsert metadata entries."""
+        conn.executemany(
+            "INSERT OR REPLACE INTO mirror_meta (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()]
+        )
+
+    def is_synced(self, sheet_id: str, sheet_name: str) -> bool:
+        """
+        Check that the mirror holds a complete copy of the given sheet tab.
+
+        Args:
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+
+        Returns:
+            True if reads can be served from the mirror
+        """
+        if not self.path.exists():
+            return False
+
+        try:
+            with closing(self._connect()) as conn:
+                meta = self._get_meta(conn)
+        except sqlite3.Error as e:
+            print(f"[WARN]  History mirror unreadable ({e})")
+            return False
+
+        return (meta.get('version') == str(MIRROR_VERSION) and
+                meta.get('sheet_id') == sheet_id and
+                meta.get('sheet_name') == sheet_name and
+                meta.get('synced') == '1')
+
+    def check_fresh(self, sheets_service, sheet_id: str, sheet_name: str) -> bool:
+        """
+        Check a synced mirror against the sheet's current row count and anchor row.
+
+        Works like RollingStateStore.check_fresh: the anchor is the last row of
+        the sheet when the mirror was last known to match it. A mirror whose row
+        count or anchor row no longer matches the sheet (rows added, deleted or
+        edited outside the pipeline) is marked stale.
+
+        Args:
+            sheets_service: Google Sheets API service instance
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+
+        Returns:
+            True if reads can be served from the mirror
+        """
+        if not self.is_synced(sheet_id, sheet_name):
+            return False
+
+        row_count = count_sheet_rows(sheets_service, sheet_id, sheet_name)
+        mirrored = self.row_count()
+        if mirrored != row_count:
+            print(f"[REFRESH] Sheet has {row_count} row(s), history mirror has {mirrored}")
+            self.mark_stale()
+            return False
+
+        with closing(self._connect()) as conn:
+            anchor = json.loads(self._get_meta(conn).get('anchor', 'null'))
+
+        # Rows appended since the anchor was taken were mirrored by SheetsWriter
+        rows = [row_count]
+        if anchor is not None and anchor['row'] != row_count:
+            rows.insert(0, anchor['row'])
+        values = read_sheet_rows(sheets_service, sheet_id, sheet_name, rows)
+
+        if anchor is not None and values[0] != anchor['values']:
+            print(f"[REFRESH] Sheet row {anchor['row'] + 1} changed since the history mirror was synced")
+            self.mark_stale()
+            return False
+
+        # Move the anchor to the current last row
+        if anchor != {'row': row_count, 'values': values[-1]}:
+            with closing(self._connect()) as conn, conn:
+                self._set_meta(conn, anchor=json.dumps({'row': row_count, 'values': values[-1]}))
+        return True
+
+    def mark_stale(self) -> None:
+        """Stop serving reads until the mirror is rebuilt from the sheet."""
+        try:
+            with closing(self._connect()) as conn, conn:
+                self._set_meta(conn, synced=0)
+        except sqlite3.Error as e:
+            print(f"[WARN]  Could not mark history mirror stale: {e}")
+
+    def rebuild(self, historical_df: pd.DataFrame, sheet_id: str, sheet_name: str,
+                anchor: Optional[Dict] = None) -> bool:
+        """
+        Replace the mirror contents with a full history loaded from the sheet.
+
+        Args:
+            historical_df: Full sheet history as parsed by VarianceEngine (row i is sheet row i + 2)
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+            anchor: Optional {'row', 'values'} of the sheet's last row as read with
+                the history (taken from the sheet on the next check_fresh otherwise)
+
+        Returns:
+            True if the mirror was rebuilt, False if the sheet layout is not mirrored
+        """
+        if not historical_df.empty and list(historical_df.columns) not in (COLUMNS, CANONICAL_SKU_COLUMNS):
+            print("[WARN]  Sheet headers do not match the canonical columns, history mirror disabled")
+            self.mark_stale()
+            return False
+
+        records = self._to_records(historical_df.reindex(columns=MIRROR_COLUMNS), first_row=2)
+        columns = len(CANONICAL_SKU_COLUMNS if 'canonical_sku' in historical_df.columns else COLUMNS)
+
+        with closing(self._connect()) as conn, conn:
+            # Recreated rather than emptied, so a mirror from an older layout gets the new columns
+            conn.execute("DROP TABLE pricing_data")
+            conn.execute("DROP TABLE sku_history")
+            self._create_schema(conn)
+            self._insert(conn, records)
+            self._write_sku_entries(conn, sku_entries(historical_df))
+            self._set_meta(conn, version=MIRROR_VERSION, sheet_id=sheet_id,
+                           sheet_name=sheet_name, columns=columns, anchor=json.dumps(anchor),
+                           synced=1)
+
+        print(f"[SAVE] History mirror rebuilt ({len(records)} rows)")
+        return True
+
+    def reconcile(self, historical_df: pd.DataFrame, sheet_id: str,
+                  sheet_name: str, anchor: Optional[Dict] = None) -> Dict[str, int]:
+        """
+        Compare the mirror with a fresh sheet load, then rebuild it from the sheet.
+
+        Args:
+            historical_df: Full sheet history as parsed by VarianceEngine
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+            anchor: Optional {'row', 'values'} of the sheet's last row (see rebuild)
+
+        Returns:
+            Dictionary with sheet_rows, mirror_rows, added, removed and changed counts
+        """
+        if self.is_synced(sheet_id, sheet_name):
+            mirrored = self.load_history().reindex(columns=MIRROR_COLUMNS)
+        else:
+            mirrored = pd.DataFrame(columns=MIRROR_COLUMNS)
+
+        sheet = historical_df.reindex(columns=MIRROR_COLUMNS)
+        common = min(len(sheet), len(mirrored))
+
+        # Compare typed values so int/float and None/NaN differences don't count
+        def align(df: pd.DataFrame) -> pd.DataFrame:
+            df = df.iloc[:common].reset_index(drop=True)
+            df = df.astype({col: float for col in NUMERIC_COLUMNS})
+            df['processed_date'] = pd.to_datetime(df['processed_date'], errors='coerce')
+            return df
+
+        left, right = align(sheet), align(mirrored)
+        differs = (left != right) & ~(left.isna() & right.isna())
+        changed = int(differs.any(axis=1).sum())
+
+        summary = {
+            'sheet_rows': len(sheet),
+            'mirror_rows': len(mirrored),
+            'added': max(len(sheet) - len(mirrored), 0),
+            'removed': max(len(mirrored) - len(sheet), 0),
+            'changed': changed
+        }
+
+        self.rebuild(historical_df, sheet_id, sheet_name, anchor)
+        return summary
+
+    def append_rows(self, sheet_id: str, sheet_name: str, start_row: int,
+                    values: List[List[str]]) -> None:
+        """
+        Record rows SheetsWriter just wrote to the sheet.
+
+        Rows are stored at their sheet row number, so a write over existing
+        rows replaces them exactly as it did in the sheet. Skipped rows are
+        stored blank, matching how the sheet reads back.
+
+        Args:
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+            start_row: Sheet row number of the first written row
+            values: Sanitized rows in SheetsWriter.columns order
+        """
+        if not self.is_synced(sheet_id, sheet_name):
+            return  # Rebuilt from the sheet on the next history load
+
+        # Rows of a sheet without canonical_sku are one cell short
+        padded = [row + [''] * (len(MIRROR_COLUMNS) - len(row)) for row in values]
+        frame = self._coerce(pd.DataFrame(padded, columns=MIRROR_COLUMNS, dtype=object))
+        records = self._to_records(frame, first_row=start_row)
+
+        with closing(self._connect()) as conn, conn:
+            last_row = conn.execute("SELECT MAX(sheet_row) FROM pricing_data").fetchone()[0] or 1
+            blank = tuple(None if col in NUMERIC_COLUMNS or col == 'processed_date' else ''
+                          for col in MIRROR_COLUMNS)
+            self._insert(conn, [(row,) + blank for row in range(last_row + 1, start_row)])
+            self._insert(conn, records)
+
+            # SheetsWriter adds the canonical_sku header before writing the column
+            columns = int(self._get_meta(conn).get('columns', len(COLUMNS)))
+            if values and len(values[0]) > columns:
+                self._set_meta(conn, columns=len(values[0]))
+
+            if start_row > last_row:
+                self._extend_sku_entries(conn, frame)
+            else:
+                # Existing rows were overwritten; recompute the series from the table
+                self._write_sku_entries(conn, sku_entries(self._read_history(conn)), replace=True)
+
+        print(f"[SAVE] History mirror updated ({len(records)} rows)")
+
+    def load_history(self) -> pd.DataFrame:
+        """
+        Load the full mirrored history in sheet order.
+
+        Returns:
+            DataFrame with the same columns and types as a sheet load
+        """
+        return self._query(f"SELECT {', '.join(map(_quote, MIRROR_COLUMNS))} "
+                           f"FROM pricing_data ORDER BY sheet_row")
+
+    def recent_rows(self, limit: int) -> pd.DataFrame:
+        """
+        Load the last rows of the mirrored history.
+
+        Args:
+            limit: Number of most recent rows
+
+        Returns:
+            DataFrame with the last rows in sheet order
+        """
+        df = self._query(f"SELECT {', '.join(map(_quote, MIRROR_COLUMNS))} FROM pricing_data "
+                         f"ORDER BY sheet_row DESC LIMIT ?", (limit,))
+        return df.iloc[::-1].reset_index(drop=True)
+
+    def sku_history(self, skus: Iterable[str]) -> Dict[str, Dict]:
+        """
+        Look up the materialized price series of the given SKUs.
+
+        Args:
+            skus: Vendor SKUs (unknown SKUs are left out of the result)
+
+        Returns:
+            Dictionary mapping vendor_sku to its sku_entry
+        """
+        skus = list(dict.fromkeys(sku for sku in skus if isinstance(sku, str) and sku))
+        entries = {}
+
+        with closing(self._connect()) as conn:
+            for start in range(0, len(skus), SQL_BATCH):
+                batch = skus[start:start + SQL_BATCH]
+                rows = conn.execute(
+                    f"SELECT {', '.join(SKU_COLUMNS)} FROM sku_history "
+                    f"WHERE vendor_sku IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+                for row in rows:
+                    entry = dict(zip(SKU_COLUMNS, row))
+                    entry['costs'] = np.frombuffer(entry['costs'], dtype=np.float64)
+                    entry['dates'] = np.frombuffer(entry['dates'], dtype=np.int64).view('datetime64[s]')
+                    entries[entry.pop('vendor_sku')] = entry
+
+        return entries
+
+    def window_state(self, skus: Iterable[str], suppliers: Iterable[str],
+                     rolling_window: int = 3, supplier_window: int = 30) -> RollingStateStore:
+        """
+        Build an in-memory rolling state for the given SKUs and suppliers.
+
+        Each SKU costs one sku_history lookup and each supplier one indexed
+        query for its last supplier_window rows, so the Variance Engine can
+        annotate without loading the full history.
+
+        Args:
+            skus: Vendor SKUs about to be annotated
+            suppliers: Suppliers about to be annotated
+            rolling_window: Number of recent records kept per SKU
+            supplier_window: Number of recent records kept per supplier
+
+        Returns:
+            RollingStateStore holding only the requested SKUs and suppliers (never saved)
+        """
+        state = RollingStateStore(self.path.with_suffix('.state.json'), rolling_window,
+                                  supplier_window)
+
+        for sku, entry in self.sku_history(skus).items():
+            state.skus[sku] = deque(
+                ((None if np.isnan(cost) else float(cost),
+                  None if np.isnat(date) else np.datetime_as_string(date, unit='s').replace('T', ' '))
+                 for cost, date in zip(entry['costs'][-rolling_window:],
+                                       entry['dates'][-rolling_window:])),
+                maxlen=rolling_window
+            )
+
+        state.suppliers = SupplierBaselines(supplier_window)
+        variance_column = _quote('variance_%')
+        with closing(self._connect()) as conn:
+            for supplier in dict.fromkeys(suppliers):
+                if not isinstance(supplier, str):
+                    continue
+                rows = conn.execute(
+                    f"SELECT {variance_column} FROM pricing_data WHERE supplier = ? "
+                    f"ORDER BY sheet_row DESC LIMIT ?", (supplier, supplier_window)
+                ).fetchall()
+                if rows:
+                    state.suppliers.load_window(supplier, [row[0] for row in reversed(rows)])
+            state.rows_seen = conn.execute("SELECT COUNT(*) FROM pricing_data").fetchone()[0]
+
+        state.loaded = True
+        return state
+
+    def invoice_ids(self) -> List[Tuple[str, str]]:
+        """Distinct (supplier, invoice_number) pairs of the mirrored rows."""
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT DISTINCT supplier, invoice_number FROM pricing_data").fetchall()
+
+    def row_count(self) -> int:
+        """Number of mirrored data rows."""
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM pricing_data").fetchone()[0]
+
+    def _query(self, sql: str, params: tuple = ()) -> pd.DataFrame:
+        """Run a SELECT over pricing_data and restore the sheet-load types."""
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(sql, conn, params=params)
+            columns = int(self._get_meta(conn).get('columns', len(MIRROR_COLUMNS)))
+        return self._restore_types(df)[MIRROR_COLUMNS[:columns]]
+
+    def _read_history(self, conn: sqlite3.Connection) -> pd.DataFrame:
+        """Read the full mirrored history on an open connection."""
+        df = pd.read_sql_query(f"SELECT {', '.join(map(_quote, MIRROR_COLUMNS))} "
+                               f"FROM pricing_data ORDER BY sheet_row", conn)
+        return self._restore_types(df)
+
+    @staticmethod
+    def _restore_types(df: pd.DataFrame) -> pd.DataFrame:
+        """Restore the sheet-load types of columns read from pricing_data."""
+
+        for col in MIRROR_COLUMNS:
+            if col in NUMERIC_COLUMNS:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+            elif col == 'processed_date':
+                df[col] = pd.to_datetime(df[col], format='ISO8601', errors='coerce')
+            else:
+                df[col] = df[col].fillna('')
+
+        return df
+
+    @staticmethod
+    def _coerce(df: pd.DataFrame) -> pd.DataFrame:
+        """Parse sanitized sheet strings into the mirror column types."""
+        for col in NUMERIC_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        df['processed_date'] = pd.to_datetime(df['processed_date'], errors='coerce')
+        return df
+
+    @staticmethod
+    def _to_records(df: pd.DataFrame, first_row: int) -> List[tuple]:
+        """Convert a typed frame to row tuples prefixed with the sheet row number."""
+        columns = []
+        for col in MIRROR_COLUMNS:
+            series = df[col]
+            if col in NUMERIC_COLUMNS:
+                values = series.astype(float).tolist()
+                columns.append([None if v != v else v for v in values])
+            elif col == 'processed_date':
+                dates = pd.to_datetime(series, errors='coerce')
+                columns.append(dates.astype(str).where(dates.notna(), None).tolist())
+            else:
+                columns.append(series.fillna('').astype(str).tolist())
+
+        rows = range(first_row, first_row + len(df))
+        return list(zip(rows, *columns))
+
+    def _extend_sku_entries(self, conn: sqlite3.Connection, frame: pd.DataFrame) -> None:
+        """Merge newly written rows into their SKUs' series, keeping processed_date order."""
+        appended = {}
+        skus = frame['vendor_sku'].fillna('').astype(str)
+        costs = pd.to_numeric(frame['unit_cost'], errors='coerce').to_numpy(dtype=float)
+        dates = pd.to_datetime(frame['processed_date'], errors='coerce').to_numpy(dtype='datetime64[s]')
+
+        existing = {}
+        for start in range(0, len(skus.unique()), SQL_BATCH):
+            batch = list(skus.unique()[start:start + SQL_BATCH])
+            rows = conn.execute(
+                f"SELECT vendor_sku, costs, dates FROM sku_history "
+                f"WHERE vendor_sku IN ({', '.join('?' * len(batch))})", batch
+            ).fetchall()
+            for sku, cost_blob, date_blob in rows:
+                existing[sku] = (np.frombuffer(cost_blob, dtype=np.float64),
+                                 np.frombuffer(date_blob, dtype=np.int64).view('datetime64[s]'))
+
+        for sku, positions in skus.groupby(skus, sort=False).indices.items():
+            if not sku:
+                continue
+            old_costs, old_dates = existing.get(sku, (np.empty(0), np.empty(0, dtype='datetime64[s]')))
+            sku_costs = np.concatenate([old_costs, costs[positions]])
+            sku_dates = np.concatenate([old_dates, dates[positions]])
+
+            # Stable, NaT last: rows dated before the series land where a rebuild puts them
+            order = np.argsort(sku_dates, kind='stable')
+            appended[sku] = sku_entry(sku_costs[order], sku_dates[order])
+
+        self._write_sku_entries(conn, appended)
+
+    @staticmethod
+    def _write_sku_entries(conn: sqlite3.Connection, entries: Dict[str, Dict],
+                           replace: bool = False) -> None:
+        """Insert or replace sku_history rows (replace=True first clears the table)."""
+        if replace:
+            conn.execute("DELETE FROM sku_history")
+
+        conn.executemany(
+            f"INSERT OR REPLACE INTO sku_history VALUES ({', '.join('?' * len(SKU_COLUMNS))})",
+            [(sku, entry['first_seen'], entry['last_seen'], entry['row_count'],
+              entry['cost_count'], entry['min_cost'], entry['max_cost'], entry['last_cost'],
+              np.ascontiguousarray(entry['costs'], dtype=np.float64).tobytes(),
+              np.ascontiguousarray(entry['dates'], dtype='datetime64[s]').view(np.int64).tobytes())
+             for sku, entry in entries.items()]
+        )
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, records: List[tuple]) -> None:
+        """Insert (or replace) row tuples."""
+        if not records:
+            return
+        placeholders = ', '.join('?' * (len(MIRROR_COLUMNS) + 1))
+        conn.executemany(f"INSERT OR REPLACE INTO pricing_data VALUES ({placeholders})", records)
+
+
+def mirror_from_config(config) -> Optional[HistoryMirror]:
+    """
+    Build the history mirror configured under paths.history_mirror.
+
+    Args:
+        config: ConfigLoader instance
+
+    Returns:
+        HistoryMirror, or None when no mirror is configured
+    """
+    path = config.config.get('paths', {}).get('history_mirror')
+    return HistoryMirror(path) if path else None
+
+
+def test_history_mirror():
+    """Test that the mirror round-trips a parsed history and appended rows."""
+    import tempfile
+
+    print("=" * 80)
+    print("HISTORY MIRROR TEST")
+    print("=" * 80)
+
+    historical_data = pd.DataFrame({
+        'vendor_sku': ['SKU001', 'SKU002', ''],
+        'description': ['Golf Balls', 'Tees', ''],
+        'quantity': [10.0, 100.0, None],
+        'unit_cost': [10.0, 0.25, None],
+        'total_cost': [100.0, 25.0, None],
+        'supplier': ['SupplierA', 'SupplierB', ''],
+        'invoice_number': ['INV-1', 'INV-2', ''],
+        'invoice_date': ['2024-01-01', '2024-01-02', ''],
+        'variance_%': [None, 4.5, None],
+        'variance_flag': ['', '🟡', ''],
+        'supplier_baseline_%': [float('nan')] * 3,
+        'impact_$': [None, 1.1, None],
+        'source_file': ['a.pdf', 'b.pdf', ''],
+        'processed_date': pd.to_datetime(['2024-03-01 10:00:00', '2024-03-02 11:30:00', None]),
+        'canonical_sku': ['SKU001', 'SKU002', '']
+    })
+    # Row as SheetsWriter sends it (sanitized strings, canonical_sku enabled)
+    appended = {col: '' for col in MIRROR_COLUMNS}
+    appended.update({'vendor_sku': 'SKU001', 'unit_cost': '12.0', 'supplier': 'SupplierA',
+                     'processed_date': '2024-03-05 09:00:00'})
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        mirror = HistoryMirror(Path(tmp_dir) / 'history.db')
+        assert not mirror.is_synced('sheet', 'Pricing Data')
+
+        mirror.rebuild(historical_data, 'sheet', 'Pricing Data')
+        pd.testing.assert_frame_equal(mirror.load_history(), historical_data, check_dtype=False)
+
+        # Rows written at sheet row 6 leave row 5 blank, as in the sheet
+        mirror.append_rows('sheet', 'Pricing Data', 6, [list(appended.values())])
+        recent = mirror.recent_rows(2)
+        print(recent[['vendor_sku', 'unit_cost', 'supplier', 'processed_date']].to_string(index=False))
+
+        assert mirror.row_count() == 5
+        assert recent['vendor_sku'].tolist() == ['', 'SKU001']
+        assert recent['unit_cost'].iloc[1] == 12.0
+
+        # The appended row extends SKU001's materialized series
+        entry = mirror.sku_history(['SKU001', 'SKU404'])
+        print(f"SKU001: {entry['SKU001']['costs'].tolist()} "
+              f"({entry['SKU001']['first_seen']} .. {entry['SKU001']['last_seen']})")
+        assert list(entry) == ['SKU001']
+        assert entry['SKU001']['row_count'] == 2 and entry['SKU001']['last_cost'] == 12.0
+        assert (entry['SKU001']['min_cost'], entry['SKU001']['max_cost']) == (10.0, 12.0)
+
+        state = mirror.window_state(['SKU001'], ['SupplierB'], rolling_window=1)
+        assert state.get_recent('SKU001') == [(12.0, '2024-03-05 09:00:00')]
+        assert list(state.suppliers.variances['SupplierB']) == [4.5]
+
+    print("\n[OK] Test complete")
+
+
+if __name__ == "__main__":
+    test_history_mirror()
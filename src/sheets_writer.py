@@ -9,13 +9,15 @@ import re
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from history_cache import history_cache
+
 
 # If modifying these scopes, delete token.json
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
@@ -38,15 +40,40 @@ COLUMNS = [
     "processed_date"
 ]
 
+# Columns of a sheet with SKU canonicalization enabled (variance_engine.canonicalize_skus)
+CANONICAL_SKU_COLUMNS = COLUMNS + ["canonical_sku"]
+
 # Numeric columns that require sanitization
 NUMERIC_COLUMNS = ["quantity", "unit_cost", "total_cost", "variance_%", "supplier_baseline_%", "impact_$"]
 
+# Maximum cells sent in one values.batchUpdate request
+BATCH_UPDATE_CELLS = 50000
+
+
+def column_letter(index: int) -> str:
+    """
+    Convert a zero-based column index to its A1 notation letter(s).
+
+    Args:
+        index: Zero-based column index (0 -> "A", 26 -> "AA")
+
+    Returns:
+        Column letter(s)
+    """
+    letters = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
 
 class SheetsWriter:
     """Writes pricing data to Google Sheets with authentication and error handling."""
 
     def __init__(self, sheet_id: str, credentials_file: str = "credentials.json",
-                 token_file: str = "token.json", sheet_name: str = "Pricing Data"):
+                 token_file: str = "token.json", sheet_name: str = "Pricing Data",
+                 mirror=None, canonicalize_skus: bool = False):
         """
         Initialize Google Sheets writer.
 
@@ -55,6 +82,9 @@ class SheetsWriter:
             credentials_file: Path to OAuth2 credentials JSON
             token_file: Path to store authentication token
             sheet_name: Name of the sheet tab to write to
+            mirror: Optional HistoryMirror that receives a copy of every appended row
+            canonicalize_skus: Write the canonical_sku column, adding its header
+                to existing sheets (default False)
 
         Raises:
             FileNotFoundError: If credentials.json doesn't exist
@@ -64,6 +94,8 @@ class SheetsWriter:
         self.credentials_file = Path(credentials_file)
         self.token_file = Path(token_file)
         self.sheet_name = sheet_name
+        self.mirror = mirror
+        self.columns = CANONICAL_SKU_COLUMNS if canonicalize_skus else COLUMNS
         self.service = None
 
         # Validate inputs
@@ -157,7 +189,7 @@ class SheetsWriter:
             Sanitized DataFrame with correct column order
         """
         # Reindex to canonical column order, filling missing columns with empty string
-        df = df.reindex(columns=COLUMNS, fill_value="")
+        df = df.reindex(columns=self.columns, fill_value="")
 
         # Replace NaN and None with empty string
         df = df.fillna("")
@@ -224,19 +256,36 @@ class SheetsWriter:
                     spreadsheetId=self.sheet_id,
                     range=f"{self.sheet_name}!A1",
                     valueInputOption='RAW',
-                    body={'values': [COLUMNS]}
+                    body={'values': [self.columns]}
+                ).execute()
+                print(f"[OK] Headers written: {self.columns}")
+                return True, self.columns
+
+            # A sheet that already has canonical_sku keeps it (blank for new rows while disabled)
+            if existing_headers == CANONICAL_SKU_COLUMNS:
+                self.columns = CANONICAL_SKU_COLUMNS
+
+            # Sheets created before trailing columns were added: append the new headers
+            if existing_headers != self.columns and existing_headers == self.columns[:len(existing_headers)]:
+                missing = self.columns[len(existing_headers):]
+                print(f"[WRITE] Migrating headers, adding: {missing}")
+                self.service.spreadsheets().values().update(
+                    spreadsheetId=self.sheet_id,
+                    range=f"{self.sheet_name}!{column_letter(len(existing_headers))}1",
+                    valueInputOption='RAW',
+                    body={'values': [missing]}
                 ).execute()
-                print(f"[OK] Headers written: {COLUMNS}")
-                return True, COLUMNS
+                history_cache.invalidate(self.sheet_id, self.sheet_name)
+                existing_headers = list(self.columns)
 
             # Verify headers match exactly
-            headers_match = existing_headers == COLUMNS
+            headers_match = existing_headers == self.columns
 
             if headers_match:
                 print(f"[OK] Header validation: OK")
             else:
                 print(f"[ERROR] Header validation: MISMATCH")
-                print(f"   Expected: {COLUMNS}")
+                print(f"   Expected: {self.columns}")
                 print(f"   Found:    {existing_headers}")
 
             return headers_match, existing_headers
@@ -282,13 +331,43 @@ class SheetsWriter:
             else:
                 raise Exception(f"[ERROR] Failed to detect next row: {e}")
 
+    def invoice_ids(self) -> List[Tuple[str, str]]:
+        """
+        Read the (supplier, invoice_number) of every data row.
+
+        Uses the history mirror when it holds a complete copy of the sheet
+        that still matches it, otherwise reads only those two columns.
+
+        Returns:
+            List of (supplier, invoice_number) pairs
+
+        Raises:
+            Exception: If sheet access fails
+        """
+        if self.mirror is not None and self.mirror.check_fresh(self.service, self.sheet_id,
+                                                                self.sheet_name):
+            return self.mirror.invoice_ids()
+
+        first = column_letter(COLUMNS.index("supplier"))
+        last = column_letter(COLUMNS.index("invoice_number"))
+        try:
+            result = self.service.spreadsheets().values().get(
+                spreadsheetId=self.sheet_id,
+                range=f"{self.sheet_name}!{first}2:{last}"
+            ).execute()
+        except HttpError as e:
+            raise Exception(f"[ERROR] Failed to read invoice IDs: {e}")
+
+        # Trailing empty cells are omitted from each row
+        return [tuple((row + ["", ""])[:2]) for row in result.get('values', [])]
+
     def append_data(self, df: pd.DataFrame) -> int:
         """
         Append DataFrame rows to Google Sheet with bulletproof alignment.
 
         Process:
-        1. Sanitize DataFrame (reindex, clean data)
-        2. Verify headers match canonical order
+        1. Verify headers match canonical order
+        2. Sanitize DataFrame (reindex, clean data)
         3. Detect next available row
         4. Append data to specific range
         5. Use RAW value input to prevent auto-formatting
@@ -306,21 +385,21 @@ class SheetsWriter:
             print("[WARN]  No data to append (DataFrame is empty)")
             return 0
 
-        # Step 1: Sanitize DataFrame
-        print(f"[CLEAN] Sanitizing {len(df)} row(s)...")
-        df_clean = self._sanitize_dataframe(df)
-
-        # Step 2: Verify headers
+        # Step 1: Verify headers (this settles which columns the sheet has)
         headers_match, existing_headers = self._verify_headers()
 
         if not headers_match:
             raise Exception(
                 f"[ERROR] Cannot append data: Header mismatch!\n"
-                f"   Expected: {COLUMNS}\n"
+                f"   Expected: {self.columns}\n"
                 f"   Found:    {existing_headers}\n"
                 f"   Please fix the Google Sheet headers to match exactly."
             )
 
+        # Step 2: Sanitize DataFrame
+        print(f"[CLEAN] Sanitizing {len(df)} row(s)...")
+        df_clean = self._sanitize_dataframe(df)
+
         # Step 3: Detect next row
         next_row = self._get_next_row()
 
@@ -342,6 +421,17 @@ class SheetsWriter:
             rows_written = result.get('updatedRows', 0)
             print(f"[OK] Write complete: {rows_written} row(s) appended")
 
+            # Keep the local history mirror in step with the sheet
+            if self.mirror is not None:
+                try:
+                    self.mirror.append_rows(self.sheet_id, self.sheet_name, next_row, values)
+                except Exception as e:
+                    print(f"[WARN]  History mirror update failed ({e}), rebuilding on next load")
+                    self.mirror.mark_stale()
+
+            # Cached history no longer matches the sheet
+            history_cache.invalidate(self.sheet_id, self.sheet_name)
+
             return rows_written
 
         except HttpError as e:
@@ -363,6 +453,90 @@ class SheetsWriter:
             else:
                 raise Exception(f"[ERROR] Failed to append data: {e}")
 
+    def update_cells(self, changes: Dict[str, pd.Series],
+                     chunk_cells: int = BATCH_UPDATE_CELLS) -> int:
+        """
+        Overwrite existing cells in place with chunked values.batchUpdate calls.
+
+        Consecutive rows of a column are sent as one range, so a column that
+        changed on every row costs one range rather than one per cell.
+
+        Args:
+            changes: Column name -> Series of new values indexed by sheet row number
+            chunk_cells: Maximum cells per batchUpdate request
+
+        Returns:
+            Number of cells updated
+
+        Raises:
+            Exception: If a batchUpdate request fails
+        """
+        ranges = []
+        for column, values in changes.items():
+            if values.empty:
+                continue
+
+            letter = column_letter(self.columns.index(column))
+            values = values.sort_index()
+            rows = values.index.to_numpy()
+            if column in NUMERIC_COLUMNS:
+                cells = [self._sanitize_numeric(value) for value in values]
+            else:
+                cells = ['' if pd.isna(value) else str(value).strip() for value in values]
+
+            # Split into runs of consecutive rows, each at most chunk_cells long
+            breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+            for run_start, run_end in zip(np.r_[0, breaks], np.r_[breaks, len(rows)]):
+                for first in range(run_start, run_end, chunk_cells):
+                    last = min(first + chunk_cells, run_end)
+                    ranges.append({
+                        'range': f"{self.sheet_name}!{letter}{rows[first]}:{letter}{rows[last - 1]}",
+                        'values': [[cell] for cell in cells[first:last]]
+                    })
+
+        if not ranges:
+            print("[OK] No cells to update")
+            return 0
+
+        # Group ranges into requests of at most chunk_cells cells
+        requests = [[]]
+        request_cells = 0
+        for value_range in ranges:
+            if requests[-1] and request_cells + len(value_range['values']) > chunk_cells:
+                requests.append([])
+                request_cells = 0
+            requests[-1].append(value_range)
+            request_cells += len(value_range['values'])
+
+        cells_updated = 0
+        try:
+            for idx, data in enumerate(requests, 1):
+                result = self.service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=self.sheet_id,
+                    body={'valueInputOption': 'RAW', 'data': data}
+                ).execute()
+                cells_updated += result.get('totalUpdatedCells', 0)
+                print(f"📤 Update request {idx}/{len(requests)}: {len(data)} range(s), "
+                      f"{cells_updated} cell(s) so far")
+
+        except HttpError as e:
+            if e.resp.status == 429:
+                raise Exception(
+                    "[ERROR] Google Sheets API quota exceeded. Please try again later or "
+                    "increase your API quota in Google Cloud Console."
+                )
+            raise Exception(f"[ERROR] Failed to update cells: {e}")
+
+        finally:
+            if cells_updated:
+                # Cached history and the mirror no longer match the sheet
+                history_cache.invalidate(self.sheet_id, self.sheet_name)
+                if self.mirror is not None:
+                    self.mirror.mark_stale()
+
+        print(f"[OK] Update complete: {cells_updated} cell(s) updated")
+        return cells_updated
+
     def write_dataframe(self, df: pd.DataFrame) -> int:
         """
         Main method to write DataFrame to Google Sheets.
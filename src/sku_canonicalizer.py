@@ -0,0 +1,327 @@
+"""
+SKU Canonicalizer for Swag Golf Pricing Intelligence Tool
+Maps formatting variants of a vendor SKU ("AB-123", "ab 123", "AB123") to one
+canonical key, and lines without a SKU to a known product by description, so
+the Variance Engine can find their history.
+"""
+
+import re
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+
+# Prefix of keys derived from a description (normalized SKUs are alphanumeric only)
+DESCRIPTION_KEY_PREFIX = 'DESC:'
+
+# Character n-gram size of the description index
+NGRAM_SIZE = 3
+
+# Posting lists longer than this are only probed for candidates found through rarer n-grams
+FREQUENT_NGRAM_POSTINGS = 1000
+
+
+def normalize_sku(sku) -> str:
+    """
+    Reduce a vendor SKU to its uppercase letters and digits.
+
+    Args:
+        sku: Raw vendor SKU (None/NaN for missing)
+
+    Returns:
+        Normalized SKU, or empty string if there is none
+    """
+    if sku is None or (isinstance(sku, float) and np.isnan(sku)):
+        return ''
+    return re.sub(r'[^0-9A-Z]', '', str(sku).upper())
+
+
+def normalize_description(description) -> str:
+    """
+    Uppercase a description and collapse punctuation and whitespace to single spaces.
+
+    Args:
+        description: Raw line description (None/NaN for missing)
+
+    Returns:
+        Normalized description, or empty string if there is none
+    """
+    if description is None or (isinstance(description, float) and np.isnan(description)):
+        return ''
+    return ' '.join(re.sub(r'[^0-9A-Z]+', ' ', str(description).upper()).split())
+
+
+def description_ngrams(description: str) -> Set[str]:
+    """
+    Character n-grams of a normalized description, padded so word edges count.
+
+    Args:
+        description: Normalized description
+
+    Returns:
+        Set of n-grams
+    """
+    padded = f" {description} "
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+class SkuCanonicalizer:
+    """
+    Assigns canonical SKU keys, backed by a character n-gram inverted index.
+
+    Lines with a SKU are keyed by the normalized SKU. Lines without one are
+    matched to the known description with the highest n-gram Dice similarity
+    (at least match_threshold). Posting lists are sorted int32 arrays of
+    description ids. A lookup counts the ids found in the query's rarer lists
+    with np.unique, then checks those candidates against the most frequent
+    lists by binary search, so its cost follows the posting hits rather than
+    the number of descriptions or history rows. Lines with no match are keyed
+    by their own description.
+    """
+
+    def __init__(self, match_threshold: float = 0.8):
+        """
+        Initialize an empty canonicalizer.
+
+        Args:
+            match_threshold: Minimum Dice similarity for a description match (default 0.8)
+        """
+        self.match_threshold = match_threshold
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget every indexed description and history row."""
+        self.descriptions: List[str] = []
+        self.description_keys: List[str] = []
+        self.description_ids: Dict[str, int] = {}
+
+        # Growable arrays: ngram -> description ids, and n-grams per description
+        self.postings: Dict[str, np.ndarray] = {}
+        self.posting_sizes: Dict[str, int] = {}
+        self.ngram_counts = np.zeros(1024, dtype=np.int32)
+
+        # Keys of the history rows already indexed, and the identity of the last one
+        self.row_keys = np.array([], dtype=object)
+        self.rows_indexed = 0
+        self.last_row: Optional[tuple] = None
+
+    def register(self, key: str, description: str) -> None:
+        """
+        Record that a normalized description belongs to a canonical key.
+
+        SKU keys take precedence over description keys for the same description.
+
+        Args:
+            key: Canonical key
+            description: Normalized description
+        """
+        if not key or not description:
+            return
+
+        idx = self.description_ids.get(description)
+        if idx is not None:
+            if self.description_keys[idx].startswith(DESCRIPTION_KEY_PREFIX):
+                self.description_keys[idx] = key
+            return
+
+        idx = len(self.descriptions)
+        ngrams = description_ngrams(description)
+        self.descriptions.append(description)
+        self.description_keys.append(key)
+        self.description_ids[description] = idx
+
+        if idx == len(self.ngram_counts):
+            self.ngram_counts = np.concatenate([self.ngram_counts, np.zeros_like(self.ngram_counts)])
+        self.ngram_counts[idx] = len(ngrams)
+
+        for ngram in ngrams:
+            posting = self.postings.get(ngram)
+            size = self.posting_sizes.get(ngram, 0)
+            if posting is None or size == len(posting):
+                grown = np.empty(max(2 * size, 4), dtype=np.int32)
+                if size:
+                    grown[:size] = posting
+                self.postings[ngram] = posting = grown
+            posting[size] = idx
+            self.posting_sizes[ngram] = size + 1
+
+    def match_description(self, description: str) -> Optional[str]:
+        """
+        Find the canonical key of the most similar known description.
+
+        Ties go to the description indexed first.
+
+        Args:
+            description: Normalized description
+
+        Returns:
+            Canonical key, or None if no description is similar enough
+        """
+        idx = self.description_ids.get(description)
+        if idx is not None:
+            return self.description_keys[idx]
+
+        ngrams = description_ngrams(description)
+        postings = sorted((self.postings[ngram][:self.posting_sizes[ngram]]
+                           for ngram in ngrams if ngram in self.postings), key=len)
+        if not postings:
+            return None
+
+        # A description sharing only the `skipped` most frequent n-grams scores at
+        # most 2 * skipped / (len(ngrams) + skipped); while that is below the
+        # threshold, those lists cannot produce a match on their own
+        probed = len(postings)
+        while probed > 1 and len(postings[probed - 1]) > FREQUENT_NGRAM_POSTINGS:
+            skipped = len(postings) - probed + 1
+            if 2 * skipped / (len(ngrams) + skipped) >= self.match_threshold:
+                break
+            probed -= 1
+
+        candidates, shared = np.unique(np.concatenate(postings[:probed]), return_counts=True)
+        for posting in postings[probed:]:
+            # Ids are appended in increasing order, so each list is sorted
+            positions = np.minimum(np.searchsorted(posting, candidates), len(posting) - 1)
+            shared += posting[positions] == candidates
+
+        scores = 2 * shared / (len(ngrams) + self.ngram_counts[candidates])
+
+        best = int(np.argmax(scores))
+        if scores[best] < self.match_threshold:
+            return None
+        return self.description_keys[candidates[best]]
+
+    def canonical_key(self, sku, description) -> str:
+        """
+        Compute the canonical key of one line and add it to the index.
+
+        Args:
+            sku: Raw vendor SKU
+            description: Raw line description
+
+        Returns:
+            Canonical key, or empty string for a line with neither SKU nor description
+        """
+        normalized = normalize_description(description)
+        key = normalize_sku(sku)
+
+        if not key and normalized:
+            key = self.match_description(normalized) or DESCRIPTION_KEY_PREFIX + normalized
+
+        self.register(key, normalized)
+        return key
+
+    def assign_keys(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Canonical keys for every row, reusing a stored canonical_sku where present.
+
+        SKUs and descriptions are normalized column-wise; each distinct
+        (key, description) pair is then resolved once, in order of first appearance.
+
+        Args:
+            df: Rows with vendor_sku, description and optionally canonical_sku
+
+        Returns:
+            Object array of canonical keys aligned with df's rows
+        """
+        if df.empty:
+            return np.array([], dtype=object)
+
+        def text(column: str, pattern: Optional[str] = None, repl: str = '') -> np.ndarray:
+            # Normalizes each distinct value once
+            if column not in df.columns:
+                return np.full(len(df), '', dtype=object)
+            codes, values = pd.factorize(df[column].fillna('').astype(str))
+            values = pd.Series(values, dtype=object)
+            if pattern is not None:
+                values = values.str.upper().str.replace(pattern, repl, regex=True).str.strip()
+            return values.to_numpy(dtype=object)[codes] if len(values) else np.full(len(df), '', dtype=object)
+
+        stored = text('canonical_sku')
+        skus = text('vendor_sku', r'[^0-9A-Z]')
+        descriptions = text('description', r'[^0-9A-Z]+', ' ')
+
+        pairs = pd.DataFrame({'key': np.where(stored != '', stored, skus), 'description': descriptions})
+        codes = pairs.groupby(['key', 'description'], sort=False).ngroup().to_numpy()
+
+        keys = []
+        for key, description in pairs.drop_duplicates().itertuples(index=False):
+            if not key and description:
+                key = self.match_description(description) or DESCRIPTION_KEY_PREFIX + description
+            self.register(key, description)
+            keys.append(key)
+
+        return np.array(keys, dtype=object)[codes]
+
+    def index_history(self, historical_df: pd.DataFrame) -> pd.Series:
+        """
+        Canonical keys for a history, indexing only rows appended since the last call.
+
+        The sheet is append-only; if the history no longer starts with the rows
+        indexed before (a different sheet, or rows edited), the index is rebuilt.
+
+        Args:
+            historical_df: Historical pricing data in sheet order
+
+        Returns:
+            Series of canonical keys aligned with historical_df
+        """
+        if not self._continues(historical_df):
+            print("[REFRESH] History changed, rebuilding SKU index")
+            self.reset()
+
+        new_rows = historical_df.iloc[self.rows_indexed:]
+        if not new_rows.empty:
+            self.row_keys = np.concatenate([self.row_keys, self.assign_keys(new_rows)])
+            self.rows_indexed = len(historical_df)
+            self.last_row = self._row_identity(historical_df, len(historical_df) - 1)
+
+        return pd.Series(self.row_keys[:len(historical_df)], index=historical_df.index)
+
+    def _continues(self, historical_df: pd.DataFrame) -> bool:
+        """Check that historical_df extends the rows indexed so far."""
+        if self.rows_indexed == 0:
+            return True
+        if len(historical_df) < self.rows_indexed:
+            return False
+        return self._row_identity(historical_df, self.rows_indexed - 1) == self.last_row
+
+    @staticmethod
+    def _row_identity(historical_df: pd.DataFrame, position: int) -> tuple:
+        """Values identifying one history row."""
+        row = historical_df.iloc[position]
+        return tuple(str(row.get(column, '')) for column in
+                     ['vendor_sku', 'description', 'source_file', 'processed_date'])
+
+
+def test_sku_canonicalizer():
+    """Test SKU canonicalization with sample data."""
+    print("=" * 80)
+    print("SKU CANONICALIZER TEST")
+    print("=" * 80)
+
+    history = pd.DataFrame({
+        'vendor_sku': ['AB-123', 'CD 456', '', 'EF789'],
+        'description': ['Golf Balls - White (12pk)', 'Tee Pack 100', 'Ball Marker Set', 'Glove L'],
+        'canonical_sku': ['', '', '', 'EF789'],
+    })
+    new_data = pd.DataFrame({
+        'vendor_sku': ['ab123', None, None, None, 'XY-1'],
+        'description': ['Golf Balls White 12pk', 'GOLF BALLS, WHITE (12 PK)', 'Ball Marker Set',
+                        'Rain Umbrella', 'Tee Pack 100'],
+    })
+
+    canonicalizer = SkuCanonicalizer(match_threshold=0.8)
+    history['canonical_sku'] = canonicalizer.index_history(history)
+    new_data['canonical_sku'] = canonicalizer.assign_keys(new_data)
+
+    print("\nHistory:")
+    print(history.to_string(index=False))
+    print("\nNew lines:")
+    print(new_data.to_string(index=False))
+
+    print("\n[OK] Test complete")
+
+
+if __name__ == "__main__":
+    test_sku_canonicalizer()
@@ -4,11 +4,26 @@ Data-scientist grade variance analysis with rolling averages, supplier baselines
 and cost impact scoring for business decision support.
 """
 
+import copy
+import time
 import pandas as pd
 import numpy as np
-from typing import Dict, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Tuple, Optional
 from datetime import datetime
 
+from history_cache import history_cache
+from rolling_state import SupplierBaselines, MIN_SUPPLIER_RECORDS
+from sheets_writer import column_letter
+from sku_canonicalizer import SkuCanonicalizer
+
+
+# Day zero of spreadsheet serial dates
+SHEETS_EPOCH = '1899-12-30'
+
+# Sheet rows read per request when paging through the history
+HISTORY_CHUNK_ROWS = 5000
+
 
 class VarianceEngine:
     """
@@ -16,8 +31,29 @@ class VarianceEngine:
     Provides intelligent flagging based on impact and historical patterns.
     """
 
+    # Sheet columns parsed as numbers
+    NUMERIC_COLUMNS = ['quantity', 'unit_cost', 'total_cost', 'variance_%',
+                       'supplier_baseline_%', 'impact_$']
+
+    # Optional output columns added when multi_window is enabled
+    MULTI_WINDOW_COLUMNS = ['short_avg_cost', 'short_median_cost', 'long_avg_cost',
+                            'long_median_cost', 'ewma_cost', 'trend_%', 'spike_%']
+
+    # Minimum SKU history before a robust z-score is reported
+    ROBUST_MIN_RECORDS = 3
+
+    # Stored annotation columns recomputed by a backfill
+    BACKFILL_COLUMNS = ['variance_%', 'variance_flag', 'supplier_baseline_%', 'impact_$']
+
     def __init__(self, green_threshold: float = 3.0, yellow_threshold: float = 10.0,
-                 rolling_window: int = 3, supplier_window: int = 30):
+                 rolling_window: int = 3, supplier_window: int = 30,
+                 vectorized: bool = True, state_store=None, delta_sync: bool = True,
+                 mirror=None, rolling_days: Optional[int] = None,
+                 multi_window: bool = False, short_window: int = 3, long_window: int = 12,
+                 ewma_span: int = 10, robust_scoring: bool = False,
+                 robust_z_threshold: float = 3.5, canonicalize_skus: bool = False,
+                 sku_match_threshold: float = 0.8,
+                 history_chunk_rows: int = HISTORY_CHUNK_ROWS):
         """
         Initialize Variance Intelligence Engine.
 
@@ -26,15 +62,64 @@ class VarianceEngine:
             yellow_threshold: Variance % threshold for yellow flag (default 10.0%)
             rolling_window: Number of historical records for rolling average (default 3)
             supplier_window: Number of supplier records for baseline (default 30)
+            vectorized: Compute rolling statistics for all SKUs in one groupby pass
+                instead of filtering the history once per new row (default True)
+            state_store: Optional RollingStateStore; when set, rolling statistics
+                and supplier baselines are read from it instead of the history
+            delta_sync: Extend an outdated cached history with only the rows
+                appended since it was loaded instead of re-reading A:Z (default True)
+            mirror: Optional HistoryMirror; when it holds a synced copy of the
+                sheet, history is read from it instead of Google Sheets (without a
+                state store, only the invoice's SKU and supplier windows are read)
+            rolling_days: Optional time window in days; when set, rolling statistics
+                cover the SKU's rows invoiced in the rolling_days before each new
+                row's invoice_date instead of the last rolling_window rows
+            multi_window: Also output short/long window statistics, an EWMA of
+                unit cost and the trend_%/spike_% signals (default False)
+            short_window: Rows in the short window (default 3)
+            long_window: Rows in the long window (default 12)
+            ewma_span: Span of the exponentially weighted average (default 10)
+            robust_scoring: Also score each line against its SKU's whole history
+                with a median/MAD z-score (robust_z, robust_flag) (default False)
+            robust_z_threshold: |robust_z| above which a line is flagged as an
+                outlier (default 3.5)
+            canonicalize_skus: Match history on canonical SKU keys (formatting
+                variants merged, SKU-less lines matched by description) and
+                store each line's key in canonical_sku (default False)
+            sku_match_threshold: Minimum description similarity for matching a
+                line without a SKU (default 0.8)
+            history_chunk_rows: Sheet rows read per request when loading the
+                history; each page is parsed before the next is fetched (default 5000)
         """
         self.green_threshold = green_threshold
         self.yellow_threshold = yellow_threshold
         self.rolling_window = rolling_window
         self.supplier_window = supplier_window
+        self.vectorized = vectorized
+        self.state_store = state_store
+        self.delta_sync = delta_sync
+        self.mirror = mirror
+        self.rolling_days = rolling_days
+        self.multi_window = multi_window
+        self.short_window = short_window
+        self.long_window = long_window
+        self.ewma_span = ewma_span
+        self.robust_scoring = robust_scoring
+        self.robust_z_threshold = robust_z_threshold
+        self.canonicalize_skus = canonicalize_skus
+        self.canonicalizer = SkuCanonicalizer(sku_match_threshold)
+        self.history_chunk_rows = history_chunk_rows
 
     def load_historical_data(self, sheets_service, sheet_id: str, sheet_name: str) -> pd.DataFrame:
         """
-        Load all historical data from Google Sheets.
+        Load all historical data, reusing the process-wide history cache.
+
+        The sheet is only read when the cache has no current entry (first load,
+        TTL expired, or SheetsWriter appended rows since). A synced history
+        mirror that still matches the sheet's row count and anchor row is
+        read in place of the sheet; otherwise, with delta sync
+        enabled, an outdated cached frame is extended with just the new rows.
+        Sheet loads reseed a configured mirror that is not synced.
 
         Args:
             sheets_service: Google Sheets API service instance
@@ -47,78 +132,354 @@ class VarianceEngine:
         Raises:
             Exception: If sheet read fails
         """
+        cached = history_cache.get(sheet_id, sheet_name)
+        if cached is not None:
+            print(f"[CACHE] Using cached history ({len(cached)} rows)")
+            return cached
+
+        version = history_cache.version(sheet_id, sheet_name)
+
+        if self._mirror_fresh(sheets_service, sheet_id, sheet_name):
+            try:
+                df = self.mirror.load_history()
+                print(f"[OK] Loaded {len(df)} historical rows from history mirror")
+                history_cache.put(sheet_id, sheet_name, df, version)
+                return df.copy(deep=False)
+            except Exception as e:
+                print(f"[WARN]  History mirror read failed ({e}), loading from Google Sheets")
+
+        base = history_cache.get_base(sheet_id, sheet_name) if self.delta_sync else None
+
+        loaded = None
+        if base is not None:
+            loaded = self._delta_sync_historical_data(sheets_service, sheet_id, sheet_name, *base)
+        if loaded is None:
+            loaded = self._fetch_historical_data(sheets_service, sheet_id, sheet_name)
+
+        df, meta = loaded
+        history_cache.put(sheet_id, sheet_name, df, version, meta)
+
+        if self.mirror is not None and meta is not None:
+            try:
+                self.mirror.rebuild(df, sheet_id, sheet_name,
+                                    {'row': meta['rows'], 'values': meta['last_row']})
+            except Exception as e:
+                print(f"[WARN]  History mirror rebuild failed: {e}")
+        return df.copy(deep=False)
+
+    def _mirror_fresh(self, sheets_service, sheet_id: str, sheet_name: str) -> bool:
+        """Check that a history mirror is configured and still matches the sheet."""
+        if self.mirror is None:
+            return False
+
         try:
-            # Read all data from sheet
-            result = sheets_service.spreadsheets().values().get(
-                spreadsheetId=sheet_id,
-                range=f"{sheet_name}!A:Z"
-            ).execute()
+            return self.mirror.check_fresh(sheets_service, sheet_id, sheet_name)
+        except Exception as e:
+            print(f"[WARN]  History mirror check failed ({e}), loading from Google Sheets")
+            return False
 
-            values = result.get('values', [])
+    def _fetch_historical_data(self, sheets_service, sheet_id: str,
+                               sheet_name: str) -> Tuple[pd.DataFrame, Dict]:
+        """
+        Download and parse all historical data from Google Sheets, page by page.
+
+        Args:
+            sheets_service: Google Sheets API service instance
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+
+        Returns:
+            Tuple of (DataFrame with historical pricing data, delta-sync metadata)
+
+        Raises:
+            Exception: If sheet read fails
+        """
+        chunks, meta = [], None
+        for chunk, meta in self.iter_historical_chunks(sheets_service, sheet_id, sheet_name):
+            chunks.append(chunk)
+
+        if meta is None:
+            print("[DATA] No historical data found in sheet (empty sheet)")
+            return pd.DataFrame(), None
+
+        print(f"   Found {len(meta['headers'])} column headers")
+        print(f"   Found {meta['rows']} data rows")
+
+        if meta['rows'] == 0:
+            print("[DATA] Sheet has headers but no data rows")
+            return chunks[0], meta
+
+        df = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+
+        print(f"[OK] Loaded {len(df)} historical rows from Google Sheet")
+
+        return df, meta
+
+    def iter_historical_chunks(self, sheets_service, sheet_id: str,
+                               sheet_name: str) -> Iterator[Tuple[pd.DataFrame, Dict]]:
+        """
+        Read the sheet in pages of history_chunk_rows rows, parsing each page as it arrives.
+
+        Only one page of raw cell values is held at a time, so a consumer that
+        folds the chunks into running aggregates never holds the whole history.
+        Blank rows at the end of a page are carried into the next page, keeping
+        row positions identical to a single A:Z read. Paging runs to the end of
+        the sheet's grid, so a run of blank rows (e.g. a cleared block) does not
+        hide the history below it.
+
+        Args:
+            sheets_service: Google Sheets API service instance
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+
+        Yields:
+            Tuple of (typed DataFrame of the page's rows, delta-sync metadata as
+            of that page). Nothing for an empty sheet; a single empty DataFrame
+            if the sheet only has headers.
+
+        Raises:
+            Exception: If sheet read fails
+        """
+        row_count = self._sheet_row_count(sheets_service, sheet_id, sheet_name)
 
-            if not values:
-                print("[DATA] No historical data found in sheet (empty sheet)")
-                return pd.DataFrame()
-
-            # First row is headers
-            headers = values[0]
-            data_rows = values[1:] if len(values) > 1 else []
-
-            print(f"   Found {len(headers)} column headers")
-            print(f"   Found {len(data_rows)} data rows")
-
-            if not data_rows:
-                print("[DATA] Sheet has headers but no data rows")
-                return pd.DataFrame(columns=headers)
-
-            # Ensure all rows have same number of columns as headers
-            padded_rows = []
-            for idx, row in enumerate(data_rows):
-                original_len = len(row)
-                # Pad short rows with empty strings
-                if len(row) < len(headers):
-                    row = list(row) + [''] * (len(headers) - len(row))
-                # Trim long rows to match headers
-                elif len(row) > len(headers):
-                    if idx == 0:  # Only log once
-                        print(f"   [WARN]  Data rows have {original_len} columns, trimming to {len(headers)}")
-                    row = list(row[:len(headers)])
-                else:
-                    row = list(row)
-                padded_rows.append(row)
-
-            # Create DataFrame
+        headers = None
+        rows_read = 0
+        pending_blank = 0
+        first_row = 1
+        last_row = self.history_chunk_rows + 1  # The first page also holds the header row
+
+        while first_row <= row_count:
+            last_row = min(last_row, row_count)
             try:
-                df = pd.DataFrame(padded_rows, columns=headers)
+                # Typed values (numbers stay numbers)
+                result = sheets_service.spreadsheets().values().get(
+                    spreadsheetId=sheet_id,
+                    range=f"{sheet_name}!A{first_row}:Z{last_row}",
+                    valueRenderOption='UNFORMATTED_VALUE',
+                    dateTimeRenderOption='SERIAL_NUMBER'
+                ).execute()
             except Exception as e:
-                print(f"   [ERROR] DataFrame creation error: {e}")
-                print(f"   Headers ({len(headers)}): {headers}")
-                print(f"   First row ({len(padded_rows[0])}): {padded_rows[0]}")
-                raise
+                raise Exception(f"Failed to load historical data: {e}")
+
+            values = result.get('values', [])
+            page_rows = last_row - first_row + 1
+
+            if headers is None:
+                if not values:
+                    return
+                headers = values[0]
+                values = values[1:]
+                page_rows -= 1
+
+            if values:
+                data_rows = [[]] * pending_blank + values
+                pending_blank = page_rows - len(values)
+                rows_read += len(data_rows)
+
+                # Remember where this load ended so the next one can fetch only new rows
+                meta = {'headers': headers, 'rows': rows_read, 'last_row': values[-1]}
+                yield self._rows_to_frame(headers, data_rows), meta
+            else:
+                pending_blank += page_rows
+
+            first_row = last_row + 1
+            last_row += self.history_chunk_rows
 
-            # Convert numeric columns
-            numeric_cols = ['quantity', 'unit_cost', 'total_cost', 'variance_%',
-                          'supplier_baseline_%', 'impact_$']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
+        if headers is not None and rows_read == 0:
+            yield pd.DataFrame(columns=headers), {'headers': headers, 'rows': 0, 'last_row': headers}
 
-            # Convert date columns
-            if 'processed_date' in df.columns:
-                df['processed_date'] = pd.to_datetime(df['processed_date'], errors='coerce')
+    @staticmethod
+    def _sheet_row_count(sheets_service, sheet_id: str, sheet_name: str) -> int:
+        """
+        Number of rows in the sheet tab's grid (blank rows included).
 
-            print(f"[OK] Loaded {len(df)} historical rows from Google Sheet")
+        Args:
+            sheets_service: Google Sheets API service instance
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
 
-            return df
+        Returns:
+            gridProperties.rowCount of the tab
 
+        Raises:
+            Exception: If the spreadsheet cannot be read or has no such tab
+        """
+        try:
+            result = sheets_service.spreadsheets().get(
+                spreadsheetId=sheet_id,
+                fields='sheets.properties(title,gridProperties.rowCount)'
+            ).execute()
         except Exception as e:
             raise Exception(f"Failed to load historical data: {e}")
 
+        for sheet in result.get('sheets', []):
+            properties = sheet.get('properties', {})
+            if properties.get('title') == sheet_name:
+                return properties.get('gridProperties', {}).get('rowCount', 0)
+
+        raise Exception(f"Failed to load historical data: sheet tab '{sheet_name}' not found")
+
+    def _delta_sync_historical_data(self, sheets_service, sheet_id: str, sheet_name: str,
+                                    base_df: pd.DataFrame,
+                                    meta: Dict) -> Optional[Tuple[pd.DataFrame, Dict]]:
+        """
+        Extend a previously loaded history with the rows appended since.
+
+        One request reads the header row and everything from the last known row
+        down. The header is read as wide as a full load, so columns added by a
+        header migration are noticed. The sheet is append-only, so if the
+        headers changed or the last known row no longer matches (rows deleted
+        or edited), None is returned and the caller falls back to a full reload.
+
+        Args:
+            sheets_service: Google Sheets API service instance
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+            base_df: History parsed by the previous load
+            meta: Metadata saved with base_df (headers, rows, last_row)
+
+        Returns:
+            Tuple of (extended DataFrame, updated metadata), or None to force a full reload
+        """
+        headers = meta['headers']
+        known_rows = meta['rows']
+        last_column = column_letter(len(headers) - 1)
+
+        # Sheet row of the last known data row (the header row when there were none)
+        overlap_row = known_rows + 1
+
+        try:
+            result = sheets_service.spreadsheets().values().batchGet(
+                spreadsheetId=sheet_id,
+                ranges=[f"{sheet_name}!A1:Z1",
+                        f"{sheet_name}!A{overlap_row}:{last_column}"],
+                valueRenderOption='UNFORMATTED_VALUE',
+                dateTimeRenderOption='SERIAL_NUMBER'
+            ).execute()
+        except Exception as e:
+            print(f"[WARN]  Delta sync failed ({e}), reloading full history")
+            return None
+
+        header_range, delta_range = result.get('valueRanges', [{}, {}])
+        current_headers = header_range.get('values', [[]])[0]
+        delta_rows = delta_range.get('values', [])
+
+        if current_headers != headers:
+            print("[REFRESH] Sheet headers changed, reloading full history")
+            return None
+
+        if not delta_rows or delta_rows[0] != meta['last_row']:
+            print("[REFRESH] Sheet was truncated or edited, reloading full history")
+            return None
+
+        new_rows = delta_rows[1:]
+        new_meta = {'headers': headers, 'rows': known_rows + len(new_rows),
+                    'last_row': delta_rows[-1]}
+
+        if not new_rows:
+            print(f"[OK] Delta sync: no new rows ({known_rows} cached)")
+            return base_df, new_meta
+
+        new_df = self._rows_to_frame(headers, new_rows)
+        df = new_df if base_df.empty else pd.concat([base_df, new_df], ignore_index=True)
+
+        print(f"[OK] Delta sync: appended {len(new_rows)} new row(s) to {known_rows} cached")
+
+        return df, new_meta
+
+    def _rows_to_frame(self, headers: List[str], data_rows: List[List]) -> pd.DataFrame:
+        """
+        Build a typed history DataFrame from raw sheet rows.
+
+        Ragged rows are padded (and long rows trimmed) by the DataFrame
+        constructor in C rather than copied row by row in Python. Cells written
+        by SheetsWriter are text; numbers and serial dates entered by hand
+        arrive already typed.
+
+        Args:
+            headers: Header row
+            data_rows: Data rows (may be shorter or longer than headers)
+
+        Returns:
+            DataFrame with numeric and date columns converted
+        """
+        width = len(headers)
+        grid = pd.DataFrame(data_rows, dtype=object)
+
+        if grid.shape[1] > width:
+            print(f"   [WARN]  Data rows have {grid.shape[1]} columns, trimming to {width}")
+        grid = grid.reindex(columns=range(width))
+
+        typed_cols = set(self.NUMERIC_COLUMNS) | {'processed_date'}
+        for idx, header in enumerate(headers):
+            if header in typed_cols:
+                continue  # Missing cells become NaN/NaT during type coercion
+
+            column = grid[idx].fillna('')
+            if pd.api.types.infer_dtype(column, skipna=False) != 'string':
+                # Hand-entered numbers in text columns (e.g. numeric SKUs) come back typed
+                column = column.map(lambda v: v if isinstance(v, str) else str(v))
+            grid[idx] = column
+
+        grid.columns = headers
+
+        return self._coerce_history_types(grid)
+
+    @staticmethod
+    def _coerce_history_types(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Convert numeric and date columns of sheet rows to their analysis types.
+
+        Args:
+            df: Rows as read from (or about to be written to) Google Sheets
+
+        Returns:
+            DataFrame with numeric columns as floats and processed_date as datetime
+        """
+        # Convert numeric columns
+        for col in VarianceEngine.NUMERIC_COLUMNS:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+
+        # Convert date columns (text timestamps or spreadsheet serial numbers)
+        if 'processed_date' in df.columns:
+            df['processed_date'] = VarianceEngine._to_datetime(df['processed_date'])
+
+        return df
+
+    @staticmethod
+    def _to_datetime(column: pd.Series) -> pd.Series:
+        """
+        Convert a date column that may mix text timestamps and serial numbers.
+
+        Args:
+            column: Values as read from the sheet
+
+        Returns:
+            datetime64 Series (NaT where a value cannot be parsed)
+        """
+        if pd.api.types.is_datetime64_any_dtype(column):
+            return column
+
+        if pd.api.types.infer_dtype(column.to_numpy(dtype=object), skipna=True) in ('string', 'empty'):
+            return pd.to_datetime(column, errors='coerce')
+
+        # Serial numbers count days from the spreadsheet epoch (1899-12-30)
+        is_serial = column.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))
+        serials = pd.to_datetime(column.where(is_serial).astype(float), unit='D',
+                                 origin=SHEETS_EPOCH, errors='coerce')
+        text = pd.to_datetime(column.where(~is_serial), errors='coerce')
+
+        return serials.where(is_serial, text)
+
     def calculate_rolling_statistics(self, historical_df: pd.DataFrame,
                                      new_df: pd.DataFrame) -> pd.DataFrame:
         """
         Calculate rolling average and median for each SKU.
 
+        With multi_window enabled, the short/long window statistics, the EWMA
+        and the trend_%/spike_% signals are added as well.
+
         Args:
             historical_df: Historical pricing data
             new_df: New invoice data to annotate
@@ -131,8 +492,45 @@ class VarianceEngine:
             new_df['rolling_avg_cost'] = None
             new_df['rolling_median_cost'] = None
             new_df['last_cost'] = None
+            if self.multi_window:
+                for col in self.MULTI_WINDOW_COLUMNS:
+                    new_df[col] = None
             return new_df
 
+        if self.rolling_days is not None:
+            new_df = self._rolling_statistics_by_days(historical_df, new_df)
+        elif self.vectorized:
+            new_df = self._rolling_statistics_vectorized(historical_df, new_df)
+        else:
+            new_df = self._rolling_statistics_per_row(historical_df, new_df)
+
+        if self.multi_window:
+            if self.rolling_days is not None or not self.vectorized:
+                # The vectorized path already computed these in its pass over the history
+                stats = self._window_statistics(
+                    historical_df, {'short': self.short_window, 'long': self.long_window},
+                    self.ewma_span
+                )
+                new_df = new_df.merge(stats, how='left', left_on='vendor_sku', right_index=True)
+            new_df = self._add_trend_signals(new_df)
+
+        skus_with_history = new_df['rolling_avg_cost'].notna().sum()
+        print(f"[OK] Calculated rolling averages for {skus_with_history} SKU(s)")
+
+        return new_df
+
+    def _rolling_statistics_per_row(self, historical_df: pd.DataFrame,
+                                    new_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Reference implementation: filter and sort the history once per new row.
+
+        Args:
+            historical_df: Historical pricing data
+            new_df: New invoice data to annotate
+
+        Returns:
+            new_df with rolling_avg_cost, rolling_median_cost and last_cost added
+        """
         # Combine historical and new data for each SKU
         rolling_stats = []
 
@@ -150,8 +548,9 @@ class VarianceEngine:
                 })
                 continue
 
-            # Sort by processed_date
-            sku_history = sku_history.sort_values('processed_date', ascending=True)
+            # Sort by processed_date (stable, so same-invoice rows keep sheet order)
+            sku_history = sku_history.sort_values('processed_date', ascending=True,
+                                                  kind='mergesort')
 
             # Get last N records for rolling window
             recent_records = sku_history.tail(self.rolling_window)
@@ -176,13 +575,260 @@ class VarianceEngine:
 
         # Add to new_df
         stats_df = pd.DataFrame(rolling_stats)
-        new_df = pd.concat([new_df.reset_index(drop=True), stats_df], axis=1)
+        return pd.concat([new_df.reset_index(drop=True), stats_df], axis=1)
 
-        skus_with_history = new_df['rolling_avg_cost'].notna().sum()
-        print(f"[OK] Calculated rolling averages for {skus_with_history} SKU(s)")
+    def _rolling_statistics_vectorized(self, historical_df: pd.DataFrame,
+                                       new_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Compute rolling statistics for every SKU at once and merge them onto new_df.
+
+        All windows (and the EWMA, with multi_window) come from one sorted pass
+        over the history, see _window_statistics; the results are joined onto
+        new_df with one left merge.
+
+        Args:
+            historical_df: Historical pricing data
+            new_df: New invoice data to annotate
+
+        Returns:
+            new_df with rolling_avg_cost, rolling_median_cost and last_cost added
+        """
+        windows = {'rolling': self.rolling_window}
+        ewma_span = None
+        if self.multi_window:
+            windows.update(short=self.short_window, long=self.long_window)
+            ewma_span = self.ewma_span
+
+        stats = self._window_statistics(historical_df, windows, ewma_span)
+
+        return new_df.reset_index(drop=True).merge(
+            stats, how='left', left_on='vendor_sku', right_index=True
+        ).reset_index(drop=True)
+
+    def _window_statistics(self, historical_df: pd.DataFrame, windows: Dict[str, int],
+                           ewma_span: Optional[int] = None) -> pd.DataFrame:
+        """
+        Compute row-count window statistics (and optionally an EWMA) for every SKU.
+
+        The history is sorted once (stable, so rows sharing a processed_date keep
+        sheet order) and the last rows of each SKU, as many as the deepest window,
+        are laid out right-aligned in one matrix. Every window is a slice of that
+        matrix. Rows without a unit_cost still occupy their place in a window, as
+        in the per-row path.
+
+        Args:
+            historical_df: Historical pricing data
+            windows: Window sizes by name; each adds {name}_avg_cost and
+                {name}_median_cost ('rolling' also adds last_cost)
+            ewma_span: Optional span of an exponentially weighted average over all
+                of a SKU's costs (pandas adjust=True, ignore_na=True), as ewma_cost
+
+        Returns:
+            DataFrame indexed by vendor_sku
+        """
+        history = pd.DataFrame({
+            'vendor_sku': historical_df['vendor_sku'],
+            'processed_date': historical_df['processed_date'],
+            'unit_cost': pd.to_numeric(historical_df['unit_cost'], errors='coerce'),
+        })
+        history = history.sort_values('processed_date', kind='mergesort')
+
+        codes, skus = pd.factorize(history['vendor_sku'])
+        costs = history['unit_cost'].to_numpy(dtype=float)
+        keep = codes >= 0  # Rows without a SKU are ignored
+        codes, costs = codes[keep], costs[keep]
+
+        # Position of each row counted from its SKU's most recent row
+        from_end = pd.Series(codes).groupby(codes).cumcount(ascending=False).to_numpy()
+
+        depth = max(max(windows.values()), 1)
+        in_tail = from_end < depth
+        tail = np.full((len(skus), depth), np.nan)
+        tail[codes[in_tail], depth - 1 - from_end[in_tail]] = costs[in_tail]
+
+        stats = {}
+        for name, size in windows.items():
+            averages, medians, last_cost = self._block_statistics(tail[:, depth - max(size, 1):])
+            stats[f'{name}_avg_cost'] = averages
+            stats[f'{name}_median_cost'] = medians
+            if name == 'rolling':
+                stats['last_cost'] = last_cost
+
+        if ewma_span is not None:
+            # Weight (1 - alpha)^age, age counted over the SKU's costs from the newest
+            alpha = 2.0 / (ewma_span + 1)
+            observed = ~np.isnan(costs)
+            observed_codes = codes[observed]
+            age = pd.Series(observed_codes).groupby(observed_codes).cumcount(
+                ascending=False).to_numpy()
+            weights = (1 - alpha) ** age
+            weighted = np.bincount(observed_codes, weights * costs[observed], minlength=len(skus))
+            norm = np.bincount(observed_codes, weights, minlength=len(skus))
+
+            ewma = np.full(len(skus), np.nan)
+            ewma[norm > 0] = weighted[norm > 0] / norm[norm > 0]
+            stats['ewma_cost'] = ewma
+
+        return pd.DataFrame(stats, index=skus)
+
+    @staticmethod
+    def _block_statistics(block: np.ndarray,
+                          with_medians: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Mean, median and most recent cost of each row of a window matrix.
+
+        Columns run oldest to newest and NaN marks a missing cost or padding.
+        Costs are summed left to right, matching pandas' Series.mean for
+        windows shorter than 8 rows.
+
+        Args:
+            block: 2-D array of window costs, one row per window
+            with_medians: Compute medians (all NaN when False, which is faster)
+
+        Returns:
+            Tuple of (averages, medians, last costs); NaN for windows without a cost
+        """
+        present = ~np.isnan(block)
+        counts = present.sum(axis=1)
+        has_cost = counts > 0
+
+        values = np.where(present, block, 0.0)
+        totals = np.zeros(len(block))
+        for column in range(block.shape[1]):
+            totals += values[:, column]
+
+        averages = np.full(len(block), np.nan)
+        averages[has_cost] = totals[has_cost] / counts[has_cost]
+        medians = np.full(len(block), np.nan)
+        if with_medians and has_cost.any():
+            medians[has_cost] = np.nanmedian(block[has_cost], axis=1)
+
+        last_idx = block.shape[1] - 1 - np.argmax(present[:, ::-1], axis=1)
+        last_cost = np.where(has_cost, block[np.arange(len(block)), last_idx], np.nan)
+
+        return averages, medians, last_cost
+
+    def _add_trend_signals(self, new_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Derive trend and spike signals from the multi-window statistics.
+
+        trend_% compares the short window average to the long one; spike_%
+        compares the current unit cost to the EWMA.
+
+        Args:
+            new_df: New invoice data with short/long averages and ewma_cost
+
+        Returns:
+            new_df with trend_% and spike_% added
+        """
+        current_cost = self._numeric_column(new_df, 'unit_cost')
+        short_avg = self._numeric_column(new_df, 'short_avg_cost')
+        long_avg = self._numeric_column(new_df, 'long_avg_cost')
+        ewma = self._numeric_column(new_df, 'ewma_cost')
+
+        long_base = np.where(long_avg > 0, long_avg, np.nan)
+        ewma_base = np.where(ewma > 0, ewma, np.nan)
+
+        new_df['trend_%'] = np.round((short_avg - long_base) / long_base * 100, 2)
+        new_df['spike_%'] = np.round((current_cost - ewma_base) / ewma_base * 100, 2)
 
         return new_df
 
+    def _rolling_statistics_by_days(self, historical_df: pd.DataFrame,
+                                    new_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Compute rolling statistics over a time window using a sorted (SKU, date) index.
+
+        The history is sorted once by SKU and date and encoded as a single int64
+        key (SKU code in the high 32 bits, seconds since the oldest row in the
+        low 32), so each new row's window is two searchsorted lookups. Means
+        come from prefix sums; medians are taken over the window slice.
+
+        A row's date is its invoice_date, or its processed_date when the invoice
+        date is missing or unparseable. The window for a new row covers
+        [date - rolling_days, date], so later-dated history is never used.
+
+        Args:
+            historical_df: Historical pricing data
+            new_df: New invoice data to annotate
+
+        Returns:
+            new_df with rolling_avg_cost, rolling_median_cost and last_cost added
+        """
+        new_df = new_df.reset_index(drop=True)
+
+        history = pd.DataFrame({
+            'vendor_sku': historical_df['vendor_sku'],
+            'date': self._window_dates(historical_df),
+            'unit_cost': pd.to_numeric(historical_df['unit_cost'], errors='coerce'),
+        })
+        history = history[history['unit_cost'].notna() & history['date'].notna()]
+
+        codes, skus = pd.factorize(history['vendor_sku'])
+        dates = history['date'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+        costs = history['unit_cost'].to_numpy(dtype=float)
+
+        # Sort by (SKU, date); lexsort is stable, so ties keep sheet order
+        origin = dates.min() if len(dates) else 0
+        order = np.lexsort((dates, codes))
+        keys = (codes[order].astype(np.int64) << 32) + (dates[order] - origin)
+        costs = costs[order]
+        prefix = np.concatenate([[0.0], np.cumsum(costs)])
+
+        # Window bounds for each new row, clipped into its SKU's key range
+        row_codes = skus.get_indexer(new_df['vendor_sku']).astype(np.int64)
+        row_dates = self._window_dates(new_df).fillna(pd.Timestamp.now())
+        row_end = row_dates.to_numpy(dtype='datetime64[s]').astype(np.int64) - origin
+        row_start = row_end - int(self.rolling_days) * 86400
+
+        high = np.searchsorted(keys, (row_codes << 32) + np.clip(row_end, -1, 2**32 - 1),
+                               side='right')
+        low = np.searchsorted(keys, (row_codes << 32) + np.clip(row_start, 0, 2**32),
+                              side='left')
+        counts = np.where(row_codes >= 0, np.maximum(high - low, 0), 0)
+
+        rolling_avg = np.full(len(new_df), np.nan)
+        rolling_median = np.full(len(new_df), np.nan)
+        last_cost = np.full(len(new_df), np.nan)
+
+        found = counts > 0
+        rolling_avg[found] = (prefix[high[found]] - prefix[low[found]]) / counts[found]
+        last_cost[found] = costs[high[found] - 1]
+        for idx in np.flatnonzero(found):
+            rolling_median[idx] = np.median(costs[low[idx]:high[idx]])
+
+        new_df['rolling_avg_cost'] = rolling_avg
+        new_df['rolling_median_cost'] = rolling_median
+        new_df['last_cost'] = last_cost
+
+        return new_df
+
+    @staticmethod
+    def _window_dates(df: pd.DataFrame) -> pd.Series:
+        """
+        Date used to place a row in a time window: invoice_date, else processed_date.
+
+        Args:
+            df: Historical or new invoice rows
+
+        Returns:
+            datetime64 Series (NaT where neither date is usable)
+        """
+        if 'invoice_date' in df.columns:
+            invoice_dates = pd.to_datetime(df['invoice_date'], format='ISO8601', errors='coerce')
+
+            # Dates typed into the sheet read back as serial numbers (as text, e.g. '45292')
+            serials = pd.to_numeric(df['invoice_date'].where(invoice_dates.isna()), errors='coerce')
+            invoice_dates = invoice_dates.fillna(VarianceEngine._to_datetime(serials))
+        else:
+            invoice_dates = pd.Series(pd.NaT, index=df.index)
+
+        if 'processed_date' in df.columns:
+            processed_dates = pd.to_datetime(df['processed_date'], errors='coerce')
+            invoice_dates = invoice_dates.fillna(processed_dates)
+
+        return invoice_dates
+
     def calculate_supplier_baseline(self, historical_df: pd.DataFrame,
                                     new_df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -200,30 +846,31 @@ class VarianceEngine:
             new_df['supplier_baseline_%'] = None
             return new_df
 
-        supplier_baselines = []
+        baselines = SupplierBaselines.from_history(historical_df, self.supplier_window)
+        return self.apply_supplier_baselines(baselines, new_df)
 
-        for idx, row in new_df.iterrows():
-            supplier = row['supplier']
+    def apply_supplier_baselines(self, baselines: SupplierBaselines,
+                                 new_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Look up each row's supplier baseline (one dictionary hit per distinct supplier).
+
+        Args:
+            baselines: Supplier baselines built from history or a state store
+            new_df: New invoice data to annotate
+
+        Returns:
+            new_df with supplier baseline added
+        """
+        by_supplier = {}
+        supplier_baselines = []
 
+        for supplier in new_df['supplier']:
             if pd.isna(supplier) or supplier == '':
                 supplier_baselines.append(None)
                 continue
-
-            # Get supplier historical records
-            supplier_history = historical_df[historical_df['supplier'] == supplier].copy()
-
-            # Limit to last N records
-            supplier_history = supplier_history.tail(self.supplier_window)
-
-            # Calculate variance percentages from historical data
-            variances = supplier_history['variance_%'].dropna()
-
-            if len(variances) >= 3:  # Need at least 3 records
-                baseline = variances.abs().mean()
-            else:
-                baseline = None
-
-            supplier_baselines.append(baseline)
+            if supplier not in by_supplier:
+                by_supplier[supplier] = baselines.baseline(supplier)
+            supplier_baselines.append(by_supplier[supplier])
 
         new_df['supplier_baseline_%'] = supplier_baselines
 
@@ -236,89 +883,139 @@ class VarianceEngine:
         """
         Calculate variance percentages and impact scores.
 
+        Works on whole columns: variance_% uses the rolling average as its base,
+        falling back to the last cost when no positive rolling average exists.
+
         Args:
             new_df: New invoice data with rolling statistics
 
         Returns:
             new_df with variance_%, impact_$, and impact_score added
         """
-        variances = []
-        impacts_dollar = []
-        impact_scores = []
+        current_cost = self._numeric_column(new_df, 'unit_cost')
+        rolling_avg = self._numeric_column(new_df, 'rolling_avg_cost')
+        last_cost = self._numeric_column(new_df, 'last_cost')
+        quantity = self._numeric_column(new_df, 'quantity')
+
+        # Pick the variance base per row (NaN comparisons are False)
+        has_cost = ~np.isnan(current_cost)
+        use_rolling = has_cost & (rolling_avg > 0)
+        use_last = has_cost & ~use_rolling & (last_cost > 0)
+        base = np.where(use_rolling, rolling_avg, np.where(use_last, last_cost, np.nan))
+
+        # Missing inputs propagate as NaN through every calculation below
+        variance_pct = np.round(((current_cost - base) / base) * 100, 2)
+        impact_dollar = np.round((current_cost - last_cost) * quantity, 2)
+        impact_score = np.abs(variance_pct) * quantity
+
+        new_df['variance_%'] = variance_pct
+        new_df['impact_$'] = impact_dollar
+        new_df['_impact_score'] = impact_score  # Internal use for sorting
 
-        for idx, row in new_df.iterrows():
-            current_cost = row['unit_cost']
-            rolling_avg = row.get('rolling_avg_cost')
-            last_cost = row.get('last_cost')
-            quantity = row['quantity']
-
-            # Calculate variance
-            if pd.notna(rolling_avg) and rolling_avg > 0 and pd.notna(current_cost):
-                # Use rolling average for variance calculation
-                variance_pct = ((current_cost - rolling_avg) / rolling_avg) * 100
-                variance_pct = round(variance_pct, 2)
-            elif pd.notna(last_cost) and last_cost > 0 and pd.notna(current_cost):
-                # Fallback to basic variance if no rolling avg
-                variance_pct = ((current_cost - last_cost) / last_cost) * 100
-                variance_pct = round(variance_pct, 2)
-            else:
-                variance_pct = None
+        print(f"[OK] Calculated variance and impact scores for {len(new_df)} row(s)")
 
-            # Calculate impact in dollars
-            if pd.notna(last_cost) and pd.notna(current_cost) and pd.notna(quantity):
-                impact_dollar = (current_cost - last_cost) * quantity
-                impact_dollar = round(impact_dollar, 2)
-            else:
-                impact_dollar = None
+        return new_df
 
-            # Calculate impact score (for prioritization)
-            if pd.notna(variance_pct) and pd.notna(quantity):
-                impact_score = abs(variance_pct) * quantity
-            else:
-                impact_score = None
+    def calculate_robust_scores(self, historical_df: pd.DataFrame,
+                                new_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Score unit costs with a robust (median/MAD) z-score per SKU.
 
-            variances.append(variance_pct)
-            impacts_dollar.append(impact_dollar)
-            impact_scores.append(impact_score)
+        Unlike the rolling mean, the median and the median absolute deviation
+        (MAD) of a SKU's whole history barely move when one misread price gets
+        into the sheet, so a single bad row does not make the next normal price
+        look like an outlier.
 
-        new_df['variance_%'] = variances
-        new_df['impact_$'] = impacts_dollar
-        new_df['_impact_score'] = impact_scores  # Internal use for sorting
+        z = 0.6745 * (cost - median) / MAD (Iglewicz and Hoaglin). When the MAD is
+        zero, the mean absolute deviation is used instead: z = (cost - median) /
+        (1.2533 * MeanAD). A SKU with fewer than ROBUST_MIN_RECORDS costs, or
+        with no spread at all, gets no score.
 
-        print(f"[OK] Calculated variance and impact scores for {len(new_df)} row(s)")
+        Args:
+            historical_df: Historical pricing data
+            new_df: New invoice data to score
+
+        Returns:
+            new_df with robust_z and robust_flag ('OUTLIER' or '') added
+        """
+        if historical_df is None or historical_df.empty:
+            new_df['robust_z'] = np.nan
+            new_df['robust_flag'] = ''
+            return new_df
+
+        stats = self._robust_statistics(historical_df)
+        matched = new_df[['vendor_sku']].merge(stats, how='left', left_on='vendor_sku',
+                                               right_index=True)
+
+        current_cost = self._numeric_column(new_df, 'unit_cost')
+        median = matched['median_cost'].to_numpy(dtype=float)
+        scale = matched['robust_scale'].to_numpy(dtype=float)
+
+        robust_z = np.round((current_cost - median) / scale, 2)
+        outlier = np.abs(robust_z) > self.robust_z_threshold  # NaN compares False
+
+        new_df['robust_z'] = robust_z
+        new_df['robust_flag'] = np.where(outlier, 'OUTLIER', '').astype(object)
+
+        print(f"[OK] Robust z-scores: {int(outlier.sum())} outlier(s) "
+              f"(|z| > {self.robust_z_threshold})")
 
         return new_df
 
-    def assign_variance_flags(self, new_df: pd.DataFrame) -> pd.DataFrame:
+    def _robust_statistics(self, historical_df: pd.DataFrame) -> pd.DataFrame:
         """
-        Assign variance flags based on thresholds.
+        Median and robust scale of unit_cost for every SKU in one vectorized pass.
 
         Args:
-            new_df: New invoice data with variance_% calculated
+            historical_df: Historical pricing data
 
         Returns:
-            new_df with variance_flag added
+            DataFrame indexed by vendor_sku with median_cost and robust_scale
+            (NaN when the SKU has too few costs or no spread)
         """
-        flags = []
+        costs = pd.to_numeric(historical_df['unit_cost'], errors='coerce')
+        observed = costs.notna().to_numpy()
 
-        for idx, row in new_df.iterrows():
-            variance = row.get('variance_%')
+        codes, skus = pd.factorize(historical_df['vendor_sku'].to_numpy()[observed])
+        values = costs.to_numpy(dtype=float)[observed]
+        keep = codes >= 0  # Rows without a SKU are ignored
+        codes, values = codes[keep], values[keep]
 
-            if pd.isna(variance):
-                # No historical data
-                flags.append('')
-                continue
+        # Every code 0..len(skus)-1 occurs, so group results line up with skus
+        median = pd.Series(values).groupby(codes).median().to_numpy()
+        deviation = np.abs(values - median[codes])
+        mad = pd.Series(deviation).groupby(codes).median().to_numpy()
 
-            abs_variance = abs(variance)
+        counts = np.bincount(codes, minlength=len(skus))
+        mean_ad = np.bincount(codes, deviation, minlength=len(skus)) / np.maximum(counts, 1)
 
-            if abs_variance <= self.green_threshold:
-                flags.append('GREEN')
-            elif abs_variance <= self.yellow_threshold:
-                flags.append('YELLOW')
-            else:
-                flags.append('RED')
+        scale = np.where(mad > 0, mad / 0.6745,
+                         np.where(mean_ad > 0, 1.253314 * mean_ad, np.nan))
+        scale[counts < self.ROBUST_MIN_RECORDS] = np.nan
+
+        return pd.DataFrame({'median_cost': median, 'robust_scale': scale}, index=skus)
+
+    def assign_variance_flags(self, new_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Assign variance flags based on thresholds.
 
-        new_df['variance_flag'] = flags
+        Args:
+            new_df: New invoice data with variance_% calculated
+
+        Returns:
+            new_df with variance_flag added
+        """
+        variance = self._numeric_column(new_df, 'variance_%')
+        abs_variance = np.abs(variance)
+
+        # Rows without a variance (no historical data) get an empty flag
+        new_df['variance_flag'] = np.select(
+            [np.isnan(variance),
+             abs_variance <= self.green_threshold,
+             abs_variance <= self.yellow_threshold],
+            ['', 'GREEN', 'YELLOW'],
+            default='RED'
+        ).astype(object)
 
         # Count flags
         flag_counts = new_df['variance_flag'].value_counts()
@@ -330,6 +1027,73 @@ class VarianceEngine:
 
         return new_df
 
+    def simulate_thresholds(self, historical_df: pd.DataFrame,
+                            green_thresholds: List[float],
+                            yellow_thresholds: List[float]) -> pd.DataFrame:
+        """
+        Count GREEN/YELLOW/RED flags and dollar impact for a grid of candidate thresholds.
+
+        The stored variance_% values are sorted once by absolute value; each
+        candidate threshold is then a searchsorted position, and band impacts
+        are differences of one cumulative impact_$ sum. Flags follow
+        assign_variance_flags exactly (GREEN <= green, YELLOW <= yellow), so a
+        pair with yellow <= green has no YELLOW rows.
+
+        Args:
+            historical_df: History with variance_% and impact_$ columns
+            green_thresholds: Candidate green thresholds (%)
+            yellow_thresholds: Candidate yellow thresholds (%)
+
+        Returns:
+            DataFrame with one row per (green, yellow) pair: green, yellow,
+            green_count, yellow_count, red_count, green_impact_$,
+            yellow_impact_$, red_impact_$ and is_current
+        """
+        variance = self._numeric_column(historical_df, 'variance_%')
+        impact = self._numeric_column(historical_df, 'impact_$')
+
+        # Rows without a variance carry no flag under any threshold
+        flagged = ~np.isnan(variance)
+        order = np.argsort(np.abs(variance[flagged]), kind='mergesort')
+        abs_sorted = np.abs(variance[flagged])[order]
+        impact_sums = np.concatenate([[0.0], np.cumsum(np.nan_to_num(impact[flagged][order]))])
+
+        green, yellow = np.meshgrid(np.asarray(green_thresholds, dtype=float),
+                                    np.asarray(yellow_thresholds, dtype=float), indexing='ij')
+        green, yellow = green.ravel(), yellow.ravel()
+
+        at_green = np.searchsorted(abs_sorted, green, side='right')
+        at_yellow = np.maximum(np.searchsorted(abs_sorted, yellow, side='right'), at_green)
+        total = len(abs_sorted)
+
+        return pd.DataFrame({
+            'green': green,
+            'yellow': yellow,
+            'green_count': at_green,
+            'yellow_count': at_yellow - at_green,
+            'red_count': total - at_yellow,
+            'green_impact_$': np.round(impact_sums[at_green], 2),
+            'yellow_impact_$': np.round(impact_sums[at_yellow] - impact_sums[at_green], 2),
+            'red_impact_$': np.round(impact_sums[total] - impact_sums[at_yellow], 2),
+            'is_current': (green == self.green_threshold) & (yellow == self.yellow_threshold),
+        })
+
+    @staticmethod
+    def _numeric_column(df: pd.DataFrame, column: str) -> np.ndarray:
+        """
+        Return a column as a float array, with NaN for missing or non-numeric values.
+
+        Args:
+            df: Source DataFrame
+            column: Column name (an all-NaN array is returned if it is absent)
+
+        Returns:
+            float64 NumPy array aligned with df's rows
+        """
+        if column not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+
     def prioritize_high_impact(self, new_df: pd.DataFrame) -> pd.DataFrame:
         """
         Sort high-impact red flags to the top and log them.
@@ -371,6 +1135,205 @@ class VarianceEngine:
 
         return new_df
 
+    def backfill_annotations(self, historical_df: pd.DataFrame, workers: int = 1) -> pd.DataFrame:
+        """
+        Recompute the stored annotations of every history row by replaying the sheet.
+
+        Rows are replayed in chronological order (stable sort on processed_date).
+        Each written invoice, a run of rows sharing processed_date and
+        source_file, is annotated against every earlier invoice and never
+        against its own rows, just as annotate_invoice_data saw the sheet when
+        the invoice was written. Supplier baselines use the replayed variance_%
+        of earlier rows. Rows with a blank SKU or supplier get no rolling
+        statistics or baseline, as blank cells do not identify a product.
+
+        The replay is vectorized: every row's window is located with one sort
+        per SKU and per supplier instead of re-running the engine per invoice.
+        SKU windows never cross SKUs and baselines never cross suppliers, so
+        with workers > 1 rows are sharded by SKU (then by supplier) and the
+        shards replayed in a process pool; the result is identical.
+
+        Args:
+            historical_df: Full sheet history as loaded by load_historical_data
+            workers: Number of worker processes (default 1: replay in this process)
+
+        Returns:
+            DataFrame aligned with historical_df holding the recomputed
+            variance_%, variance_flag, supplier_baseline_% and impact_$
+            (plus canonical_sku when canonicalize_skus is set)
+
+        Raises:
+            Exception: If a time-based rolling window is configured
+        """
+        if self.rolling_days is not None:
+            raise Exception("Backfill replays row-count windows only; unset rolling_days")
+
+        if historical_df.empty:
+            columns = self.BACKFILL_COLUMNS + (['canonical_sku'] if self.canonicalize_skus else [])
+            return pd.DataFrame(columns=columns, index=historical_df.index)
+
+        # Replay order: same stable processed_date sort the engine applies to history
+        dates = pd.to_datetime(historical_df['processed_date'], errors='coerce')
+        order = dates.reset_index(drop=True).sort_values(kind='mergesort').index.to_numpy()
+        history = historical_df.iloc[order].reset_index(drop=True)
+        dates = dates.iloc[order].reset_index(drop=True)
+
+        # Invoice batches: consecutive rows sharing processed_date and source_file
+        if 'source_file' in history.columns:
+            sources = history['source_file']
+        else:
+            sources = pd.Series('', index=history.index)
+        batches = np.cumsum((dates.ne(dates.shift()) | sources.ne(sources.shift())).to_numpy())
+
+        print(f"[DATA] Replaying {len(history)} row(s) across {batches[-1]} invoice batch(es)")
+
+        # Rolling statistics: the rolling_window SKU rows before the row's batch
+        if self.canonicalize_skus:
+            # Stored keys are reused; rows written before canonicalization get theirs now
+            keys = SkuCanonicalizer(self.canonicalizer.match_threshold).assign_keys(historical_df)
+            skus = pd.Series(keys[order])
+        else:
+            skus = history['vendor_sku']
+
+        costs = pd.to_numeric(history['unit_cost'], errors='coerce').to_numpy(dtype=float)
+        sku_codes, _ = pd.factorize(skus.replace('', np.nan))
+        rolling_avg, last_cost = self._map_shards(
+            _replay_rolling_shard, self.rolling_window, sku_codes, [batches, costs], workers)
+
+        annotated = pd.DataFrame({
+            'unit_cost': costs,
+            'quantity': pd.to_numeric(history['quantity'], errors='coerce'),
+            'rolling_avg_cost': rolling_avg,
+            'last_cost': last_cost,
+        })
+        annotated = self.calculate_variance_and_impact(annotated)
+        annotated = self.assign_variance_flags(annotated)
+
+        # Supplier baselines: mean |variance_%| over the supplier_window rows before the batch
+        variance = annotated['variance_%'].to_numpy(dtype=float)
+        supplier_codes, _ = pd.factorize(history['supplier'].replace('', np.nan))
+        baseline, = self._map_shards(
+            _replay_supplier_shard, self.supplier_window, supplier_codes, [batches, variance], workers)
+
+        result = pd.DataFrame({
+            'variance_%': variance,
+            'variance_flag': annotated['variance_flag'].to_numpy(),
+            'supplier_baseline_%': baseline,
+            'impact_$': annotated['impact_$'].to_numpy(dtype=float),
+        })
+        if self.canonicalize_skus:
+            result['canonical_sku'] = skus.to_numpy()
+        result.index = historical_df.index[order]
+
+        return result.reindex(historical_df.index)
+
+    @staticmethod
+    def _map_shards(function: Callable, window: int, codes: np.ndarray,
+                    arrays: List[np.ndarray], workers: int) -> List[np.ndarray]:
+        """
+        Run a replay function over key shards and scatter its outputs back into row order.
+
+        Rows are assigned to shards by key code, so every key's rows stay in
+        one shard. Shards travel to the workers as plain NumPy arrays; outputs
+        are written back by row position, which makes the merge independent of
+        the order shards finish in.
+
+        Args:
+            function: Module-level replay function (window, codes, *arrays) -> tuple of arrays
+            window: Window size passed to function
+            codes: Key code per row in replay order (-1 for rows without a key)
+            arrays: Per-row input arrays in replay order
+            workers: Number of worker processes (1 runs function once, in process)
+
+        Returns:
+            List of per-row output arrays
+        """
+        if workers <= 1 or len(codes) == 0:
+            return list(function(window, codes, *arrays))
+
+        shard_ids = np.where(codes >= 0, codes, 0) % workers
+        shards = [rows for rows in (np.flatnonzero(shard_ids == shard) for shard in range(workers))
+                  if len(rows)]
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as pool:
+            results = list(pool.map(function, [window] * len(shards),
+                                    *zip(*[[codes[rows]] + [a[rows] for a in arrays]
+                                           for rows in shards])))
+
+        outputs = [np.empty(len(codes), dtype=part.dtype) for part in results[0]]
+        for rows, result in zip(shards, results):
+            for output, part in zip(outputs, result):
+                output[rows] = part
+
+        return outputs
+
+    @staticmethod
+    def _replay_windows(codes: np.ndarray, batches: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Locate each replayed row in its key's chronological sequence of rows.
+
+        Args:
+            codes: SKU or supplier code per row, in replay order (-1 for none)
+            batches: Invoice batch number per row, non-decreasing
+
+        Returns:
+            Tuple of (sequence, end, start). sequence holds row numbers grouped by
+            key, each group in replay order. For every row, the rows visible to it
+            are sequence[start:end]: start is where its key's group begins and end
+            is the first row of its own batch. Rows without a key get end = start = -1.
+        """
+        rows = np.arange(len(codes))
+        sequence = np.lexsort((rows, codes))
+        sequence_codes = codes[sequence]
+        sequence_batches = batches[sequence]
+
+        key_begins = np.r_[True, sequence_codes[1:] != sequence_codes[:-1]]
+        batch_begins = key_begins | np.r_[True, sequence_batches[1:] != sequence_batches[:-1]]
+        positions = np.arange(len(sequence))
+
+        end = np.empty(len(codes), dtype=np.int64)
+        start = np.empty(len(codes), dtype=np.int64)
+        end[sequence] = np.maximum.accumulate(np.where(batch_begins, positions, 0))
+        start[sequence] = np.maximum.accumulate(np.where(key_begins, positions, 0))
+
+        end[codes < 0] = -1
+        start[codes < 0] = -1
+
+        return sequence, end, start
+
+    @staticmethod
+    def changed_annotations(historical_df: pd.DataFrame,
+                            backfilled: pd.DataFrame) -> Dict[str, pd.Series]:
+        """
+        Find the annotation cells whose recomputed value differs from the stored one.
+
+        Numbers within a relative 1e-9 of each other count as unchanged, so
+        floating point noise never rewrites a cell.
+
+        Args:
+            historical_df: History as loaded from the sheet
+            backfilled: Result of backfill_annotations for that history
+
+        Returns:
+            Column name -> Series of new values for the changed rows (historical_df index)
+        """
+        changes = {}
+        for column in backfilled.columns:
+            new_values = backfilled[column]
+            # Sheets written before a column existed have it blank everywhere
+            stored = historical_df.get(column, pd.Series('', index=historical_df.index))
+            if column not in VarianceEngine.NUMERIC_COLUMNS:
+                stored = stored.fillna('').astype(str)
+                differs = stored.ne(new_values.fillna('').astype(str))
+            else:
+                stored = pd.to_numeric(stored, errors='coerce').to_numpy(dtype=float)
+                recomputed = new_values.to_numpy(dtype=float)
+                same = np.isclose(stored, recomputed, rtol=1e-9, atol=1e-12, equal_nan=True)
+                differs = pd.Series(~same, index=historical_df.index)
+            changes[column] = new_values[differs]
+
+        return changes
+
     def annotate_invoice_data(self, new_df: pd.DataFrame, sheets_service,
                               sheet_id: str, sheet_name: str) -> pd.DataFrame:
         """
@@ -384,6 +1347,9 @@ class VarianceEngine:
         5. Assign variance flags
         6. Prioritize high-impact items
 
+        Wall-clock time and row count of every stage, plus the size of the
+        history used, are attached to the result as attrs['timings'].
+
         Args:
             new_df: New invoice data to annotate
             sheets_service: Google Sheets API service
@@ -397,36 +1363,386 @@ class VarianceEngine:
         print("VARIANCE INTELLIGENCE ENGINE (V2)")
         print("=" * 80)
 
-        # Step 1: Load historical data
+        # Step 1: Load historical data (or just this invoice's SKU windows)
+        started = time.perf_counter()
+        window_state = self._mirror_window_state([new_df], sheets_service, sheet_id, sheet_name)
+        historical_df = None if window_state is not None else \
+            self._load_history_for_annotation(sheets_service, sheet_id, sheet_name)
+        load_seconds = time.perf_counter() - started
+
+        # Steps 2-6: Annotate against the history
+        new_df = self._annotate_against_history(new_df, historical_df, window_state, load_seconds)
+
+        print("\n" + "=" * 80)
+        print(f"[OK] Variance analysis complete: {len(new_df)} annotated rows ready")
+        print("=" * 80 + "\n")
+
+        return new_df
+
+    def annotate_invoice_batch(self, invoices: List[pd.DataFrame], sheets_service,
+                               sheet_id: str, sheet_name: str) -> List[pd.DataFrame]:
+        """
+        Annotate several invoices in order against a single history load.
+
+        Each annotated invoice is added to the in-memory history (or a copy of
+        the state store) before the next one is annotated, exactly as if it had
+        been written to the sheet in between. The results therefore match calling
+        annotate_invoice_data once per invoice with a write after each call. The
+        state store itself is left alone; pass each invoice to
+        record_written_rows once it is actually written.
+
+        Each result carries attrs['timings'] like annotate_invoice_data; the
+        shared history load is counted on the first annotated invoice only.
+
+        Args:
+            invoices: Extracted invoice DataFrames, in processing order
+            sheets_service: Google Sheets API service
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+
+        Returns:
+            Annotated DataFrames, one per input invoice and in the same order
+        """
+        print("\n" + "=" * 80)
+        print(f"VARIANCE INTELLIGENCE ENGINE (V2) - BATCH OF {len(invoices)} INVOICE(S)")
+        print("=" * 80)
+
+        # Step 1: Load historical data (or the batch's SKU windows) once for the whole batch
+        started = time.perf_counter()
+        window_state = self._mirror_window_state(invoices, sheets_service, sheet_id, sheet_name)
+        historical_df = None if window_state is not None else \
+            self._load_history_for_annotation(sheets_service, sheet_id, sheet_name)
+        load_seconds = time.perf_counter() - started
+
+        # Nothing is written yet, so later invoices see earlier ones through a copy
+        if window_state is None and historical_df is None and len(invoices) > 1:
+            window_state = copy.deepcopy(self.state_store)
+
+        annotated = []
+        for idx, new_df in enumerate(invoices, 1):
+            if new_df.empty:
+                annotated.append(new_df)
+                continue
+
+            print(f"\n--- Invoice {idx}/{len(invoices)} ({len(new_df)} row(s)) ---")
+            new_df = self._annotate_against_history(new_df, historical_df, window_state, load_seconds)
+            annotated.append(new_df)
+            load_seconds = None
+
+            # Earlier invoices in the batch count as history for later ones
+            if window_state is not None:
+                window_state.update(new_df)
+            if historical_df is not None:
+                historical_df = self._append_to_history(historical_df, new_df)
+
+        total_rows = sum(len(df) for df in annotated)
+        print("\n" + "=" * 80)
+        print(f"[OK] Variance analysis complete: {total_rows} annotated rows ready "
+              f"across {len(invoices)} invoice(s)")
+        print("=" * 80 + "\n")
+
+        return annotated
+
+    def _needs_history(self) -> bool:
+        """Check whether the enabled options need the full history."""
+        # Ring buffers keep only the last rolling_window rows per raw SKU; time
+        # windows, multi-window statistics, robust scores and canonical keys
+        # need the history
+        return (self.rolling_days is not None or self.multi_window or
+                self.robust_scoring or self.canonicalize_skus)
+
+    def _mirror_window_state(self, invoices: List[pd.DataFrame], sheets_service,
+                             sheet_id: str, sheet_name: str):
+        """
+        Read the rolling windows of the invoices' SKUs and suppliers from the mirror.
+
+        Used when there is no state store: the mirror's per-SKU table answers
+        each SKU with one lookup, so the full history is not loaded.
+
+        Args:
+            invoices: Invoice DataFrames about to be annotated
+            sheets_service: Google Sheets API service
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+
+        Returns:
+            In-memory RollingStateStore, or None if the history has to be loaded
+        """
+        if (self.state_store is not None or self._needs_history() or
+                not self._mirror_fresh(sheets_service, sheet_id, sheet_name)):
+            return None
+
+        skus = [sku for df in invoices if not df.empty for sku in df['vendor_sku'].dropna()]
+        suppliers = [supplier for df in invoices if not df.empty
+                     for supplier in df['supplier'].dropna()]
+
+        print("\n[DATA] Reading SKU and supplier windows from history mirror...")
+        try:
+            window_state = self.mirror.window_state(skus, suppliers, self.rolling_window,
+                                                    self.supplier_window)
+        except Exception as e:
+            print(f"[WARN]  History mirror read failed ({e}), loading full history")
+            return None
+
+        print(f"[OK] Loaded windows for {len(window_state.skus)} SKU(s) and "
+              f"{len(window_state.suppliers.variances)} supplier(s)")
+        return window_state
+
+    def _load_history_for_annotation(self, sheets_service, sheet_id: str,
+                                     sheet_name: str) -> Optional[pd.DataFrame]:
+        """
+        Load the history needed for annotation (step 1).
+
+        Args:
+            sheets_service: Google Sheets API service
+            sheet_id: Google Sheets spreadsheet ID
+            sheet_name: Sheet tab name
+
+        Returns:
+            Historical DataFrame, or None when a current state store makes it unnecessary
+        """
+        if self.state_store is not None and not self._needs_history():
+            if self.state_store.check_fresh(sheets_service, sheet_id, sheet_name):
+                print("\n[DATA] Rolling state is current, skipping full history load")
+                return None
+
+            # An edited sheet row may be mirrored too; rebuild the mirror with the store
+            if self.state_store.sheet_edited and self.mirror is not None:
+                self.mirror.mark_stale()
+
+            if not self._history_at_hand(sheets_service, sheet_id, sheet_name):
+                # Fold the sheet into the store page by page instead of loading it whole
+                print("\n[REFRESH] Rolling state missing or stale, streaming sheet history into it...")
+                last_meta = {}
+
+                def chunks():
+                    for chunk, meta in self.iter_historical_chunks(sheets_service, sheet_id, sheet_name):
+                        last_meta.update(meta)
+                        yield chunk
+
+                self.state_store.rebuild_from_chunks(chunks(), sheet_id, sheet_name)
+                if last_meta:
+                    self.state_store.set_anchor(last_meta['rows'], last_meta['last_row'])
+                self.state_store.save()
+                print(f"[SAVE] Rolling state rebuilt for {len(self.state_store.skus)} SKU(s) "
+                      f"from {self.state_store.rows_seen} row(s)")
+                return None
+
         print("\n[DATA] Loading historical data from Google Sheets...")
         historical_df = self.load_historical_data(sheets_service, sheet_id, sheet_name)
+        if self.state_store is not None:
+            base = history_cache.get_base(sheet_id, sheet_name)
+            self.state_store.sync(historical_df, sheet_id, sheet_name,
+                                  base[1] if base is not None else None)
+
+        return historical_df
+
+    def _history_at_hand(self, sheets_service, sheet_id: str, sheet_name: str) -> bool:
+        """Check whether the history can be loaded without reading the full sheet."""
+        if history_cache.get(sheet_id, sheet_name) is not None:
+            return True
+        return self._mirror_fresh(sheets_service, sheet_id, sheet_name)
+
+    def _annotate_against_history(self, new_df: pd.DataFrame,
+                                  historical_df: Optional[pd.DataFrame],
+                                  window_state=None,
+                                  load_seconds: Optional[float] = None) -> pd.DataFrame:
+        """
+        Run annotation steps 2-6 for one invoice.
+
+        Args:
+            new_df: New invoice data to annotate
+            historical_df: Historical pricing data (None to read from the rolling state)
+            window_state: Rolling state to read instead of the state store
+            load_seconds: Time spent on step 1, recorded as the load_history stage
+                (None when the load was shared with an earlier invoice)
+
+        Returns:
+            Annotated DataFrame; attrs['timings'] holds the stage timings:
+                {
+                    'history_rows': int (rows of the history used),
+                    'stages': dict (stage -> {'seconds': float, 'rows': int}),
+                    'total_seconds': float
+                }
+        """
+        if window_state is None:
+            window_state = self.state_store
+
+        history_rows = len(historical_df) if historical_df is not None else window_state.rows_seen
+        stages = {}
+        if load_seconds is not None:
+            stages['load_history'] = {'seconds': load_seconds, 'rows': history_rows}
+        rows = len(new_df)
+        started = time.perf_counter()
+
+        def record(stage: str) -> None:
+            # Each stage runs from the end of the previous one
+            nonlocal started
+            now = time.perf_counter()
+            stages[stage] = {'seconds': now - started, 'rows': rows}
+            started = now
+
+        vendor_skus = None
+        if self.canonicalize_skus and historical_df is not None:
+            # Steps 2-4 match rows on vendor_sku, so run them on canonical keys
+            print("\n🔑 Matching SKUs to canonical keys...")
+            history_keys = self.canonicalizer.index_history(historical_df)
+            new_df['canonical_sku'] = self.canonicalizer.assign_keys(new_df)
+            vendor_skus = new_df['vendor_sku'].copy()
+
+            # Blank keys identify nothing and never match
+            historical_df = historical_df.assign(vendor_sku=history_keys.where(history_keys != ''))
+            new_df['vendor_sku'] = new_df['canonical_sku'].where(new_df['canonical_sku'] != '')
+            print(f"[OK] Canonical keys: {new_df['canonical_sku'].ne('').sum()} of {len(new_df)} row(s), "
+                  f"{(new_df['canonical_sku'] != vendor_skus.fillna('')).sum()} differ from vendor_sku")
+            record('canonical_keys')
 
         # Step 2: Calculate rolling statistics
         print("\n📈 Calculating rolling averages and medians...")
-        new_df = self.calculate_rolling_statistics(historical_df, new_df)
+        if historical_df is None:
+            new_df = window_state.rolling_statistics(new_df)
+        else:
+            new_df = self.calculate_rolling_statistics(historical_df, new_df)
+        record('rolling_stats')
 
         # Step 3: Calculate supplier baselines
         print("\n🏢 Calculating supplier-level baselines...")
-        new_df = self.calculate_supplier_baseline(historical_df, new_df)
+        if historical_df is None:
+            new_df = self.apply_supplier_baselines(window_state.suppliers, new_df)
+        else:
+            new_df = self.calculate_supplier_baseline(historical_df, new_df)
+        record('supplier_baseline')
 
         # Step 4: Calculate variance and impact
         print("\n🧮 Calculating variance percentages and impact scores...")
         new_df = self.calculate_variance_and_impact(new_df)
+        record('variance')
+
+        if self.robust_scoring:
+            print("\n🛡️ Calculating robust z-scores...")
+            new_df = self.calculate_robust_scores(historical_df, new_df)
+            record('robust_scores')
+
+        if vendor_skus is not None:
+            new_df['vendor_sku'] = vendor_skus.to_numpy()
 
         # Step 5: Assign flags
         print("\n🚦 Assigning variance flags...")
         new_df = self.assign_variance_flags(new_df)
+        record('flags')
 
         # Step 6: Prioritize high impact
         print("\n🎯 Prioritizing high-impact variances...")
         new_df = self.prioritize_high_impact(new_df)
+        record('prioritize')
 
-        print("\n" + "=" * 80)
-        print(f"[OK] Variance analysis complete: {len(new_df)} annotated rows ready")
-        print("=" * 80 + "\n")
+        new_df.attrs['timings'] = {
+            'history_rows': history_rows,
+            'stages': stages,
+            'total_seconds': sum(stage['seconds'] for stage in stages.values())
+        }
+        print("\n⏱️  Stage timings: " +
+              ", ".join(f"{stage} {timing['seconds']:.2f}s" for stage, timing in stages.items()) +
+              f" (history: {history_rows} rows)")
 
         return new_df
 
+    def _append_to_history(self, historical_df: pd.DataFrame,
+                           annotated_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Append annotated rows to the history as they would read back from the sheet.
+
+        Args:
+            historical_df: Historical pricing data
+            annotated_df: Annotated invoice rows, in write order
+
+        Returns:
+            Extended historical DataFrame
+        """
+        rows = annotated_df.copy()
+
+        # The sheet stores missing text values as empty strings
+        text_cols = rows.columns.difference(
+            ['quantity', 'unit_cost', 'total_cost', 'variance_%',
+             'supplier_baseline_%', 'impact_$', 'processed_date'])
+        rows[text_cols] = rows[text_cols].fillna('')
+        rows = self._coerce_history_types(rows)
+
+        if historical_df.empty:
+            return rows.reset_index(drop=True)
+
+        return pd.concat([historical_df, rows], ignore_index=True)
+
+    def record_written_rows(self, written_df: pd.DataFrame) -> None:
+        """
+        Feed rows that were just appended to Google Sheets into the state store.
+
+        Args:
+            written_df: Annotated rows, in the order they were written
+        """
+        if self.state_store is None or written_df.empty:
+            return
+
+        self.state_store.update(written_df)
+        self.state_store.save()
+
+
+def _replay_rolling_shard(rolling_window: int, codes: np.ndarray, batches: np.ndarray,
+                          costs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rolling average and last cost of each replayed row (one backfill shard).
+
+    Args:
+        rolling_window: Number of earlier SKU rows in the window
+        codes: SKU code per row, in replay order (-1 for none)
+        batches: Invoice batch number per row
+        costs: Unit cost per row
+
+    Returns:
+        Tuple of (rolling averages, last costs)
+    """
+    sequence, end, start = VarianceEngine._replay_windows(codes, batches)
+
+    window = max(rolling_window, 1)
+    block = np.full((len(codes), window), np.nan)
+    for column in range(window):
+        position = end - window + column
+        valid = position >= start
+        block[valid, column] = costs[sequence[position[valid]]]
+
+    rolling_avg, _, last_cost = VarianceEngine._block_statistics(block, with_medians=False)
+    return rolling_avg, last_cost
+
+
+def _replay_supplier_shard(supplier_window: int, codes: np.ndarray, batches: np.ndarray,
+                           variance: np.ndarray) -> Tuple[np.ndarray]:
+    """
+    Supplier baseline of each replayed row (one backfill shard).
+
+    Args:
+        supplier_window: Number of earlier supplier rows in the window
+        codes: Supplier code per row, in replay order (-1 for none)
+        batches: Invoice batch number per row
+        variance: Replayed variance_% per row
+
+    Returns:
+        Tuple of (supplier baselines,)
+    """
+    present = ~np.isnan(variance)
+    sequence, end, start = VarianceEngine._replay_windows(codes, batches)
+
+    abs_variance = np.where(present, np.abs(variance), 0.0)
+    abs_sums = np.concatenate([[0.0], np.cumsum(abs_variance[sequence])])
+    counts = np.concatenate([[0], np.cumsum(present[sequence])])
+    window_start = np.maximum(end - supplier_window, start)
+    window_counts = counts[end] - counts[window_start]
+
+    baseline = np.full(len(codes), np.nan)
+    has_baseline = (window_counts >= MIN_SUPPLIER_RECORDS) & (end >= 0)
+    baseline[has_baseline] = ((abs_sums[end] - abs_sums[window_start])[has_baseline] /
+                              window_counts[has_baseline])
+    return baseline,
+
 
 def test_variance_engine():
     """Test variance engine with sample data."""
@@ -482,6 +1798,60 @@ def test_variance_engine():
     print(new_data[['vendor_sku', 'unit_cost', 'variance_%', 'variance_flag',
                     'supplier_baseline_%', 'impact_$']].to_string(index=False))
 
+    # Time window: only rows dated in the 30 days before the invoice count
+    print("\nCalculating 30-day rolling statistics...")
+    windowed = VarianceEngine(rolling_days=30).calculate_rolling_statistics(
+        historical_data, new_data[['vendor_sku', 'unit_cost', 'invoice_date']].copy()
+    )
+    print(windowed[['vendor_sku', 'rolling_avg_cost', 'last_cost']].to_string(index=False))
+
+    # An invoice date typed into the sheet reads back as a serial number (45352 is 2024-03-01)
+    serial_dated = new_data[['vendor_sku', 'unit_cost', 'invoice_date']].copy()
+    serial_dated.loc[0, 'invoice_date'] = '45352'
+    serial_windowed = VarianceEngine(rolling_days=30).calculate_rolling_statistics(
+        historical_data, serial_dated
+    )
+    pd.testing.assert_frame_equal(serial_windowed.drop(columns='invoice_date'),
+                                  windowed.drop(columns='invoice_date'))
+    print("[OK] Serial-number invoice date windowed like its text form")
+
+    # Short/long windows and EWMA from the same pass
+    print("\nCalculating multi-window statistics...")
+    trends = VarianceEngine(multi_window=True, short_window=2, long_window=3,
+                            ewma_span=3).calculate_rolling_statistics(
+        historical_data, new_data[['vendor_sku', 'unit_cost']].copy()
+    )
+    print(trends[['vendor_sku', 'short_avg_cost', 'long_avg_cost', 'ewma_cost',
+                  'trend_%', 'spike_%']].to_string(index=False))
+
+    # Robust z-scores against each SKU's whole history
+    print("\nCalculating robust z-scores...")
+    robust = VarianceEngine(robust_scoring=True).calculate_robust_scores(
+        historical_data, new_data[['vendor_sku', 'unit_cost']].copy()
+    )
+    print(robust.to_string(index=False))
+
+    # Re-annotate the history plus the new invoice as one sheet
+    print("\nBackfilling the combined sheet...")
+    sheet = pd.concat([
+        historical_data.assign(quantity=10, source_file='old.pdf'),
+        new_data.assign(processed_date=pd.to_datetime(new_data['processed_date']))
+    ], ignore_index=True)
+    backfilled = engine.backfill_annotations(sheet)
+    changes = engine.changed_annotations(sheet, backfilled)
+    print(backfilled.to_string())
+    print(f"Changed cells: { {column: len(values) for column, values in changes.items()} }")
+
+    # Sharded replay in worker processes gives the same result
+    sharded = engine.backfill_annotations(sheet, workers=2)
+    pd.testing.assert_frame_equal(sharded, backfilled)
+    print("Sharded replay (2 workers) matches")
+
+    # What-if: flag counts for a small grid of candidate thresholds
+    print("\nSimulating thresholds...")
+    print(engine.simulate_thresholds(sheet.assign(**backfilled), [2.0, 3.0, 5.0], [8.0, 10.0])
+          .to_string(index=False))
+
     print("\n[OK] Test complete")
 
 